@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def sync_thumbnails(settings):
+    # фоновый поток писал бы в SQLite в памяти, а она блокирует таблицы
+    # без ожидания - миниатюры режутся сразу
+    settings.THUMBNAIL_ASYNC = False
@@ -0,0 +1,94 @@
+"""Бэкенды кэша и шаблонов, которые сообщают о себе в core.metrics."""
+import os
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.files import locks
+from django.core.cache.backends import dummy, filebased, locmem
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+
+from core import metrics
+
+MISSING = object()
+# файл блокировки add в каталоге файлового кэша
+ADD_LOCK = 'add.lock'
+
+
+class CacheMetricsMixin:
+    """Считает попадания и промахи get/get_many."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, MISSING, version=version)
+        if value is MISSING:
+            metrics.count('cache_misses')
+            return default
+        metrics.count('cache_hits')
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with metrics.muted():
+            found = super().get_many(keys, version=version)
+        metrics.count('cache_hits', len(found))
+        metrics.count('cache_misses', len(keys) - len(found))
+        return found
+
+
+class LocMemCache(CacheMetricsMixin, locmem.LocMemCache):
+    pass
+
+
+class FileBasedCache(CacheMetricsMixin, filebased.FileBasedCache):
+    """Файловый кэш, в котором add атомарен между процессами.
+
+    У Django add - это has_key и затем set, и два воркера могут оба
+    "взять" блокировку пересчета. Здесь проверка и запись идут под
+    файловой блокировкой, общей для всех add этого каталога.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        with open(os.path.join(self._dir, ADD_LOCK), 'ab') as lock:
+            locks.lock(lock, locks.LOCK_EX)
+            try:
+                return super().add(key, value, timeout, version)
+            finally:
+                locks.unlock(lock)
+
+
+def is_process_local(alias: str = 'default') -> bool:
+    return isinstance(caches[alias], (locmem.LocMemCache, dummy.DummyCache))
+
+
+def event_timeout(timeout, alias: str = 'default'):
+    """Срок записи, которую сбрасывают события (None - бессрочно).
+
+    Кэш в памяти процесса не видит сбросов из других воркеров, поэтому
+    в нем запись живет не дольше LOCAL_CACHE_TIMEOUT.
+    """
+    if not is_process_local(alias):
+        return timeout
+    if timeout is None:
+        return settings.LOCAL_CACHE_TIMEOUT
+    return min(timeout, settings.LOCAL_CACHE_TIMEOUT)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        with metrics.timer('template_ms'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Шаблоны Django с замером времени отрисовки."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
@@ -0,0 +1,47 @@
+import functools
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """Представление сделало больше SQL-запросов, чем объявлено."""
+
+
+def query_budget(limit: int):
+    """Ограничивает число SQL-запросов представления.
+
+    Запросы считаются вместе с отрисовкой шаблона. При превышении
+    пишет предупреждение в лог, а при QUERY_BUDGET_RAISE выбрасывает
+    QueryBudgetExceeded. Лимит доступен тестам как view.query_budget.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            queries = []
+
+            def count(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count):
+                response = view(request, *args, **kwargs)
+
+            if len(queries) > limit:
+                message = (
+                    f'{view.__module__}.{view.__name__}: '
+                    f'{len(queries)} SQL-запросов при бюджете {limit}'
+                )
+                if settings.QUERY_BUDGET_RAISE:
+                    raise QueryBudgetExceeded(
+                        '\n'.join([message, *queries])
+                    )
+                logger.warning(message)
+            return response
+
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
@@ -0,0 +1,190 @@
+"""Метрики запросов по представлениям.
+
+MetricsMiddleware собирает для каждого запроса время ответа,
+число и время SQL-запросов, время отрисовки шаблонов и попадания
+в кэш, а registry раскладывает их по гистограммам с ключом
+view_name. Гистограммы живут в памяти процесса: у каждого воркера
+свои, отдаются staff-представлением core.views.metrics вместе
+с разделами, которые приложения добавляют через register_report.
+
+Шаблоны и кэш сообщают о себе через backends из core.backends,
+пока в потоке идет запись (recording).
+"""
+import math
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+METRICS = (
+    'wall_ms', 'sql_count', 'sql_ms', 'template_ms',
+    'cache_hits', 'cache_misses',
+)
+PERCENTILES = (50, 95, 99)
+
+_local = threading.local()
+
+
+class Histogram:
+    """Гистограмма с логарифмическими корзинами.
+
+    Корзина i покрывает [GROWTH ** i, GROWTH ** (i + 1)), поэтому
+    перцентили точны примерно до 5% при любом разбросе значений,
+    а память не зависит от числа замеров. Нули в отдельной корзине.
+    """
+
+    GROWTH = 2 ** (1 / 8)
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        bucket = None
+        if value > 0:
+            bucket = math.floor(math.log(value, self.GROWTH))
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def _value(self, bucket) -> float:
+        if bucket is None:
+            return 0.0
+        # середина корзины в логарифмической шкале
+        return min(self.GROWTH ** (bucket + 0.5), self.max)
+
+    def percentile(self, percent: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(
+                self.buckets, key=lambda b: -math.inf if b is None else b):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return self._value(bucket)
+        return self.max
+
+    def summary(self) -> dict:
+        summary = {
+            'count': self.count,
+            'mean': round(self.total / self.count, 2) if self.count else 0,
+            'max': round(self.max, 2),
+        }
+        for percent in PERCENTILES:
+            summary[f'p{percent}'] = round(self.percentile(percent), 2)
+        return summary
+
+
+class Registry:
+    """Гистограммы метрик по именам представлений."""
+
+    def __init__(self):
+        self._views = defaultdict(lambda: defaultdict(Histogram))
+        self._lock = threading.Lock()
+
+    def record(self, view: str, values: dict) -> None:
+        with self._lock:
+            histograms = self._views[view]
+            for name in METRICS:
+                histograms[name].record(values.get(name, 0))
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                view: {
+                    name: histogram.summary()
+                    for name, histogram in histograms.items()
+                }
+                for view, histograms in sorted(self._views.items())
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._views.clear()
+
+
+registry = Registry()
+
+# отчеты приложений для core.views.metrics_report: имя -> функция
+_reports = {}
+
+
+def register_report(name: str, report) -> None:
+    """Добавить в отчет метрик раздел name со значением report()."""
+    _reports[name] = report
+
+
+def reports() -> dict:
+    return {name: report() for name, report in sorted(_reports.items())}
+
+
+class Recorder:
+    """Метрики одного запроса."""
+
+    def __init__(self):
+        self.values = defaultdict(float)
+        self.running = set()
+        self.muted = 0
+
+    def sql(self, execute, sql, params, many, context):
+        """Обертка для connection.execute_wrapper."""
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.values['sql_count'] += 1
+            self.values['sql_ms'] += (perf_counter() - start) * 1000
+
+
+def current() -> Recorder:
+    return getattr(_local, 'recorder', None)
+
+
+@contextmanager
+def recording():
+    previous = current()
+    _local.recorder = recorder = Recorder()
+    try:
+        yield recorder
+    finally:
+        _local.recorder = previous
+
+
+def count(name: str, value: int = 1) -> None:
+    recorder = current()
+    if recorder is not None and not recorder.muted:
+        recorder.values[name] += value
+
+
+@contextmanager
+def muted():
+    """Не считать вложенные вызовы (get_many через get)."""
+    recorder = current()
+    if recorder is None:
+        yield
+        return
+    recorder.muted += 1
+    try:
+        yield
+    finally:
+        recorder.muted -= 1
+
+
+@contextmanager
+def timer(name: str):
+    """Добавить время блока в мс; вложенные блоки не считаются дважды."""
+    recorder = current()
+    if recorder is None or name in recorder.running:
+        yield
+        return
+    recorder.running.add(name)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        recorder.running.discard(name)
+        recorder.values[name] += (perf_counter() - start) * 1000
@@ -0,0 +1,68 @@
+from contextlib import ExitStack
+from random import random
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+from core import metrics, querylog
+
+UNRESOLVED = '<unresolved>'
+
+
+class MetricsMiddleware:
+    """Пишет метрики запроса в гистограммы его представления.
+
+    Ставится в начало (сразу после QueryLogMiddleware), чтобы время
+    ответа включало остальные middleware. Выключается настройкой
+    METRICS_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        start = perf_counter()
+        with metrics.recording() as recorder, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder.sql))
+            response = self.get_response(request)
+        recorder.values['wall_ms'] = (perf_counter() - start) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        metrics.registry.record(
+            match.view_name if match else UNRESOLVED, recorder.values
+        )
+        return response
+
+
+class QueryLogMiddleware:
+    """Отдает SQL доли запросов в журнал медленных запросов.
+
+    Запрос выбирается с вероятностью QUERY_LOG_SAMPLE_RATE; при нуле
+    middleware только проверяет настройку. Ставится первым, чтобы
+    EXPLAIN после ответа не попадал в метрики представления.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.QUERY_LOG_SAMPLE_RATE
+        if not rate or random() >= rate:
+            return self.get_response(request)
+
+        capture = querylog.Capture(settings.QUERY_LOG_SLOW_MS)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(capture))
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        querylog.registry.record(
+            match.view_name if match else UNRESOLVED, capture
+        )
+        return response
@@ -0,0 +1,69 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import AutoField, Max
+from django.utils.functional import cached_property
+
+# меньше этого числа строк таблицу дешевле посчитать точно
+ESTIMATE_FROM = 10000
+# выборку с фильтром считаем не дальше этого числа строк
+COUNT_LIMIT = 10000
+
+
+def estimate_count(queryset):
+    """Примерное число строк таблицы модели без COUNT(*).
+
+    PostgreSQL отдает оценку из статистики, остальные базы - MAX(id),
+    который не меньше числа строк. None, если оценить нечем.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        return row[0] if row and row[0] >= 0 else None
+    if isinstance(model._meta.pk, AutoField):
+        return model._default_manager.using(queryset.db).aggregate(
+            estimate=Max('pk')
+        )['estimate'] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator для списков админки на больших таблицах.
+
+    Без фильтров число строк оценивается, с фильтром или поиском
+    считается не больше COUNT_LIMIT строк: дальние страницы такой
+    выборки недоступны, их стоит сузить фильтром.
+
+    Оценка по MAX(id) с дырами в id больше настоящего числа строк:
+    если страница по оценке оказалась пустой, строки считаются точно
+    и отдается последняя непустая страница.
+    """
+
+    estimated = False
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_count(queryset)
+            if estimate is not None and estimate >= ESTIMATE_FROM:
+                self.estimated = True
+                return estimate
+            return queryset.count()
+        return queryset.order_by()[:COUNT_LIMIT].count()
+
+    def page(self, number):
+        page = super().page(number)
+        # bool() выполняет срез и кэширует его в самом QuerySet,
+        # поэтому админка потом не читает страницу второй раз
+        if self.estimated and page.number > 1 and not page.object_list:
+            self.estimated = False
+            self.count = self.object_list.count()
+            self.__dict__.pop('num_pages', None)
+            page = super().page(self.num_pages)
+        return page
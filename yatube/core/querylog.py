@@ -0,0 +1,155 @@
+"""Журнал медленных SQL-запросов по представлениям.
+
+QueryLogMiddleware для доли запросов (QUERY_LOG_SAMPLE_RATE) ставит
+Capture через connection.execute_wrapper, а в конце запроса registry
+сводит SQL к отпечаткам (fingerprint) и копит число и время каждого
+отпечатка под именем представления. Для отпечатка, который хоть раз
+выполнялся дольше QUERY_LOG_SLOW_MS, один раз снимается план
+(EXPLAIN QUERY PLAN на SQLite) - уже после ответа, вне обертки.
+
+Как и core.metrics, журнал живет в памяти процесса; ранжированный
+отчет отдает staff-представление core.views.slow_queries_report.
+"""
+import re
+import threading
+from functools import lru_cache
+from time import perf_counter
+
+from django.db import DatabaseError, connections
+
+# отпечатков на процесс: остальные только считаются в dropped
+MAX_ENTRIES = 1000
+ORDERINGS = ('total_ms', 'mean_ms', 'max_ms', 'count', 'slow')
+EXPLAINED = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+# IN (%s, %s, ...) и строки VALUES любой длины - один отпечаток
+PLACEHOLDERS = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+SPACES = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql: str) -> str:
+    """SQL без литералов и длины списков параметров."""
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    sql = PLACEHOLDERS.sub('(...)', sql)
+    sql = ROWS.sub('(...)', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+class Capture:
+    """Обертка для connection.execute_wrapper: SQL одного запроса."""
+
+    def __init__(self, slow_ms: float):
+        self.slow_ms = slow_ms
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (perf_counter() - start) * 1000
+            slow = elapsed >= self.slow_ms and not many
+            self.queries.append((
+                sql, elapsed, slow, context['connection'].alias,
+                params if slow else None
+            ))
+
+
+class Entry:
+    __slots__ = ('count', 'total_ms', 'max_ms', 'slow', 'plan')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow = 0
+        self.plan = None
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 2),
+            'mean_ms': round(self.total_ms / self.count, 2),
+            'max_ms': round(self.max_ms, 2),
+            'slow': self.slow,
+            'plan': self.plan,
+        }
+
+
+def explain(alias: str, sql: str, params) -> list:
+    """План запроса; None, если база его не дает."""
+    if not sql.lstrip().upper().startswith(EXPLAINED):
+        return None
+    connection = connections[alias]
+    prefix = connection.ops.explain_query_prefix()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}', params)
+            return [str(row[-1]) for row in cursor.fetchall()]
+    except (DatabaseError, NotImplementedError):
+        return None
+
+
+class Registry:
+    """Время и число выполнений отпечатков по представлениям."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.dropped = 0
+
+    def record(self, view: str, capture: Capture) -> None:
+        candidates = {}
+        with self._lock:
+            self.requests += 1
+            for sql, elapsed, slow, alias, params in capture.queries:
+                key = (view, fingerprint(sql))
+                entry = self._entries.get(key)
+                if entry is None:
+                    if len(self._entries) >= MAX_ENTRIES:
+                        self.dropped += 1
+                        continue
+                    entry = self._entries[key] = Entry()
+                entry.count += 1
+                entry.total_ms += elapsed
+                entry.max_ms = max(entry.max_ms, elapsed)
+                if slow:
+                    entry.slow += 1
+                    if entry.plan is None:
+                        candidates[key] = (alias, sql, params)
+        # EXPLAIN без блокировки: это еще по запросу к базе на отпечаток
+        for key, query in candidates.items():
+            plan = explain(*query)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.plan is None:
+                    entry.plan = plan or []
+
+    def report(self, order: str = 'total_ms', limit: int = 50) -> dict:
+        """Отпечатки по убыванию order, не больше limit."""
+        with self._lock:
+            queries = [
+                {'view': view, 'sql': sql, **entry.summary()}
+                for (view, sql), entry in self._entries.items()
+            ]
+            requests, dropped = self.requests, self.dropped
+        queries.sort(key=lambda query: query[order], reverse=True)
+        return {
+            'requests': requests,
+            'dropped': dropped,
+            'queries': queries[:limit],
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.requests = self.dropped = 0
+
+
+registry = Registry()
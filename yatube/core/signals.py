@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    """PRAGMA из SQLITE_PRAGMAS для каждого нового соединения SQLite.
+
+    Пишутся в соединение sqlite3 напрямую, мимо курсоров Django, чтобы
+    не попадать в метрики и журнал запросов того, кто открыл соединение.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
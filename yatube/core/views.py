@@ -1,5 +1,11 @@
+import os
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render
 
+from core import metrics, querylog
+
 
 def page_not_found(request, exception):
     return render(
@@ -22,3 +28,29 @@ def access_denied(request, exception):
         'core/403_permission_denied.html',
         {'path': request.path}, status=403
     )
+
+
+@staff_member_required
+def metrics_report(request):
+    """Перцентили метрик по представлениям этого процесса."""
+    return JsonResponse(
+        {
+            'pid': os.getpid(),
+            'views': metrics.registry.report(),
+            **metrics.reports(),
+        },
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+@staff_member_required
+def slow_queries_report(request):
+    """Отпечатки SQL этого процесса по убыванию ?order=, не больше ?limit=."""
+    order = request.GET.get('order', 'total_ms')
+    limit = request.GET.get('limit', '50')
+    if order not in querylog.ORDERINGS or not limit.isdigit():
+        return HttpResponseBadRequest()
+    return JsonResponse(
+        {'pid': os.getpid(), **querylog.registry.report(order, int(limit))},
+        json_dumps_params={'ensure_ascii': False}
+    )
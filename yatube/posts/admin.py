@@ -1,19 +1,75 @@
+from functools import partial
+
 from django.contrib import admin
+from django.contrib.admin.widgets import ForeignKeyRawIdWidget
+from django.db.models import Q
+
+from core.paginators import EstimatedCountPaginator
 
+from . import search
 from .models import Comment, Follow, Group, Post
 
 
-class GroupAdmin(admin.ModelAdmin):
+class ListRawIdWidget(ForeignKeyRawIdWidget):
+    """Поле id без подписи: подпись - отдельный запрос на строку."""
+
+    def label_and_url_for_value(self, value):
+        return '', ''
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Общие настройки списков для больших таблиц.
+
+    Число строк оценивается, а не считается, второй COUNT для
+    "всего" не делается. exact_search_fields ищутся точным
+    совпадением, чтобы поиск шел по индексу, а не LIKE '%...%'.
+    Внешние ключи из list_editable стоит указывать в raw_id_fields:
+    в списке они становятся полем id без запросов на строку.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    exact_search_fields = ()
+    empty_value_display = '-пусто-'
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not self.exact_search_fields or not search_term:
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        condition = Q()
+        for field in self.exact_search_fields:
+            condition |= Q(**{field: search_term})
+        return queryset.filter(condition), False
+
+    def get_changelist_formset(self, request, **kwargs):
+        kwargs.setdefault(
+            'formfield_callback',
+            partial(self.changelist_formfield, request=request)
+        )
+        return super().get_changelist_formset(request, **kwargs)
+
+    def changelist_formfield(self, db_field, request, **kwargs):
+        formfield = self.formfield_for_dbfield(db_field, request, **kwargs)
+        widget = getattr(formfield, 'widget', None)
+        if isinstance(widget, ForeignKeyRawIdWidget):
+            formfield.widget = ListRawIdWidget(
+                widget.rel, widget.admin_site, widget.attrs, widget.db
+            )
+        return formfield
+
+
+class GroupAdmin(ScalableAdmin):
     list_display = (
         'title',
         'slug',
         'description',
     )
     search_fields = ('title',)
-    empty_value_display = '-пусто-'
 
 
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScalableAdmin):
     list_display = (
         'pk',
         'text',
@@ -21,33 +77,47 @@ class PostAdmin(admin.ModelAdmin):
         'author',
         'group',
     )
+    list_select_related = ('author', 'group')
+    raw_id_fields = ('author', 'group')
     list_editable = ('group',)
     search_fields = ('text', )
     list_filter = ('pub_date',)
-    empty_value_display = '-пусто-'
+
+    def get_search_results(self, request, queryset, search_term):
+        # текст ищется по полнотекстовому индексу
+        if search_term.strip() and search.enabled():
+            ids = search.search(search_term).ids
+            return queryset.filter(pk__in=ids), False
+        return super().get_search_results(request, queryset, search_term)
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableAdmin):
     list_display = (
         'post',
         'author',
         'text',
         'created',
     )
+    list_select_related = ('post', 'author')
+    raw_id_fields = ('post', 'author')
     list_editable = ('text',)
-    search_fields = ('author',)
+    search_fields = ('author__username',)
+    exact_search_fields = ('author__username',)
     list_filter = ('created',)
-    empty_value_display = '-пусто-'
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdmin):
     list_display = (
         'user',
         'author',
     )
+    list_select_related = ('user', 'author')
+    raw_id_fields = ('user', 'author')
     list_editable = ('author',)
-    list_filter = ('author',)
-    empty_value_display = '-пусто-'
+    search_fields = ('user__username', 'author__username')
+    # подписчики автора ищутся по его точному имени, без фильтра
+    # со списком всех авторов
+    exact_search_fields = ('user__username', 'author__username')
 
 
 admin.site.register(Post, PostAdmin)
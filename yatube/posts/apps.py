@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from core import metrics
+
+        from . import lookups, signals  # noqa: F401
+        # попадания кэша групп, пользователей и подписок
+        metrics.register_report('lookups', lookups.stats)
@@ -0,0 +1,247 @@
+"""Нагрузочный прогон представлений posts.
+
+Сценарий - запрос к представлению через тестовый клиент Django.
+Каждый выполняется warmup раз без замера и requests раз с замером
+времени ответа и числа SQL-запросов. run() возвращает словарь,
+который команда benchmark пишет в JSON, а compare() сравнивает
+его с прогоном другого коммита.
+
+concurrency() нагружает базу одновременно читателями и писателями
+в потоках, у каждого потока свое соединение. На SQLite это имеет смысл
+только для файловой базы: база в памяти общая у потоков с блокировкой
+таблиц, журнал и PRAGMA на нее не влияют.
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+from itertools import count
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import lookups
+from .models import Group, Post, User
+
+Scenario = namedtuple('Scenario', 'name method url data user')
+
+# сравниваемые метрики: рост больше порога - регрессия
+COMPARED = ('p50_ms', 'p95_ms', 'queries_mean')
+
+
+def _get(name: str, url: str, user=None) -> Scenario:
+    return Scenario(name, 'get', url, None, user)
+
+
+def scenarios() -> list:
+    """Сценарии по самым нагруженным объектам базы."""
+    reader = User.objects.order_by('-profile__following_count').first()
+    star = User.objects.order_by('-profile__followers_count').first()
+    group = Group.objects.order_by('-posts_count').first()
+    post = Post.objects.order_by('-comments_count').first()
+    if reader is None or post is None:
+        return []
+    pages = math.ceil(
+        Post.objects.count() / settings.NUMBER_OF_LINES_ON_PAGE
+    )
+    word = max(post.text.split(), key=len).strip('.,!?')
+
+    result = [
+        _get('index', reverse('posts:index')),
+        _get('index_deep', reverse('posts:index') + f'?page={min(pages, 50)}'),
+        _get('profile', reverse('posts:profile', args=[star.username])),
+        _get('post_detail', reverse('posts:post_detail', args=[post.pk])),
+        _get('follow_index', reverse('posts:follow_index'), reader),
+        _get('search', reverse('posts:search') + '?' + urlencode({'q': word})),
+        Scenario(
+            'post_create', 'post', reverse('posts:post_create'),
+            {'text': 'Нагрузочный пост'}, reader
+        ),
+        Scenario(
+            'add_comment', 'post',
+            reverse('posts:add_comment', args=[post.pk]),
+            {'text': 'Нагрузочный комментарий'}, reader
+        ),
+    ]
+    if group is not None:
+        result.insert(2, _get(
+            'group_list', reverse('posts:group_list', args=[group.slug])
+        ))
+    return result
+
+
+def percentile(values: list, percent: float) -> float:
+    """Перцентиль по ближайшему рангу отсортированного списка."""
+    if not values:
+        return 0.0
+    rank = max(math.ceil(len(values) * percent / 100), 1)
+    return values[rank - 1]
+
+
+def _clear_caches() -> None:
+    cache.clear()
+    lookups.groups.local.clear()
+    lookups.users.local.clear()
+
+
+def _client(scenario: Scenario) -> Client:
+    client = Client()
+    if scenario.user is not None:
+        client.force_login(scenario.user)
+    return client
+
+
+def _latencies(latencies: list) -> dict:
+    """Среднее и перцентили времени ответа в мс."""
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+    return {
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+    }
+
+
+def measure(scenario: Scenario, requests: int, warmup: int,
+            cold: bool = False) -> dict:
+    send = getattr(_client(scenario), scenario.method)
+
+    latencies, queries, errors = [], [], 0
+    for i in range(warmup + requests):
+        if cold:
+            _clear_caches()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = send(scenario.url, scenario.data)
+            elapsed = time.perf_counter() - start
+        if i < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        queries.append(len(captured))
+        errors += response.status_code >= 400
+
+    total = sum(latencies) / 1000
+    return {
+        'requests': requests,
+        'errors': errors,
+        'rps': round(requests / total, 1) if total else 0,
+        **_latencies(latencies),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def run(requests: int = 50, warmup: int = 5, cold: bool = False,
+        only=None) -> dict:
+    """Прогнать сценарии; only - имена сценариев для выборочного прогона."""
+    results = {}
+    for scenario in scenarios():
+        if only and scenario.name not in only:
+            continue
+        _clear_caches()
+        results[scenario.name] = measure(scenario, requests, warmup, cold)
+    return results
+
+
+def _hammer(senders: list, duration: float, cold: bool) -> tuple:
+    """Слать запросы по кругу duration секунд: (времена в мс, ошибки)."""
+    latencies, failed = [], 0
+    deadline = time.perf_counter() + duration
+    for i in count():
+        begin = time.perf_counter()
+        if begin >= deadline:
+            break
+        send, scenario = senders[i % len(senders)]
+        if cold:
+            _clear_caches()
+        try:
+            failed += send(scenario.url, scenario.data).status_code >= 400
+        except DatabaseError:
+            failed += 1
+        latencies.append((time.perf_counter() - begin) * 1000)
+    return latencies, failed
+
+
+def concurrency(readers: int, writers: int, duration: float,
+                cold: bool = False) -> dict:
+    """Читатели и писатели в потоках одновременно, duration секунд.
+
+    Читатели по кругу проходят GET-сценарии, писатели - POST. Ошибки
+    базы (database is locked) считаются ошибками запроса.
+    """
+    reads, writes = [], []
+    for scenario in scenarios():
+        (reads if scenario.method == 'get' else writes).append(scenario)
+    if not reads or not writes:
+        return {}
+    roles = {'read': (readers, reads), 'write': (writers, writes)}
+    latencies = {role: [] for role in roles}
+    errors = dict.fromkeys(roles, 0)
+    lock = threading.Lock()
+    start = threading.Barrier(readers + writers)
+
+    def worker(role: str, items: list) -> None:
+        try:
+            senders = [
+                (getattr(_client(scenario), scenario.method), scenario)
+                for scenario in items
+            ]
+            start.wait()
+            mine, failed = _hammer(
+                senders, duration, cold and role == 'read'
+            )
+        finally:
+            # у потока свое соединение
+            connection.close()
+        with lock:
+            latencies[role] += mine
+            errors[role] += failed
+
+    threads = [
+        threading.Thread(target=worker, args=(role, items))
+        for role, (number, items) in roles.items()
+        for _ in range(number)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        role: {
+            'threads': roles[role][0],
+            'requests': len(latencies[role]),
+            'errors': errors[role],
+            'rps': round(len(latencies[role]) / duration, 1),
+            **_latencies(latencies[role]),
+        }
+        for role in roles
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Сравнение с прежним прогоном.
+
+    Строки (сценарий, метрика, было, стало, регрессия ли): время
+    хуже больше чем на threshold или запросов стало больше.
+    """
+    rows = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in COMPARED:
+            before, after = previous.get(metric, 0), current[metric]
+            if metric == 'queries_mean':
+                worse = after > before
+            else:
+                worse = after > before * (1 + threshold)
+            rows.append((name, metric, before, after, worse))
+    return rows
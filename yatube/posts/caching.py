@@ -0,0 +1,238 @@
+"""Кэш страниц лент с версиями.
+
+У каждой ленты (главная, группа, профиль) есть счетчик поколения.
+Сохранение и удаление постов, групп и пользователей увеличивает
+счетчики затронутых лент, а закэшированная страница помнит поколение,
+для которого собрана, и после смены поколения считается устаревшей.
+
+Страницы читаются через get_or_compute: пересчитывает один воркер,
+остальные отдают прежнюю версию, пока он не закончит.
+
+Счетчики и страницы живут долго только в общем кэше: в кэше процесса
+их срок ограничен core.backends.event_timeout.
+"""
+import hashlib
+import math
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.http import HttpRequest, HttpResponse
+from django.utils.http import quote_etag
+
+from core.backends import event_timeout
+
+from .models import Comment, Group, Post
+
+INDEX = 'index'
+
+GENERATION_KEY = 'feed:generation:{}'
+PAGE_KEY = 'feed:page:{}:{}'
+LOCK_KEY = '{}:lock'
+FRAGMENT_KEY = 'post:fragment:{}:{}'
+
+# сколько держится блокировка пересчета, если воркер упал
+LOCK_TIMEOUT = 30
+# сколько ждать чужого пересчета, когда отдать нечего
+LOCK_WAIT = 5
+LOCK_POLL = 0.05
+
+
+def group_scope(slug: str) -> str:
+    return f'group:{slug}'
+
+
+def profile_scope(username: str) -> str:
+    return f'profile:{username}'
+
+
+def get_generation(scope: str) -> int:
+    key = GENERATION_KEY.format(scope)
+    generation = cache.get(key)
+    if generation is None:
+        # счетчик вытеснен или еще не создан: время в мс заведомо
+        # больше любого прежнего значения, старые страницы не всплывут
+        cache.add(key, int(time.time() * 1000), event_timeout(None))
+        generation = cache.get(key)
+    return generation
+
+
+def bump(*scopes: str) -> None:
+    """Сделать устаревшими закэшированные страницы лент."""
+    for scope in scopes:
+        try:
+            cache.incr(GENERATION_KEY.format(scope))
+        except ValueError:
+            # счетчика нет - при следующем чтении создастся новый
+            pass
+
+
+def post_scopes(post, old_group_id: int = None) -> list:
+    """Ленты, на которых виден пост."""
+    scopes = [INDEX, profile_scope(post.author.username)]
+    if post.group_id is not None:
+        scopes.append(group_scope(post.group.slug))
+    if old_group_id is not None and old_group_id != post.group_id:
+        slug = Group.objects.filter(pk=old_group_id).values_list(
+            'slug', flat=True
+        ).first()
+        if slug is not None:
+            scopes.append(group_scope(slug))
+    return scopes
+
+
+def get_or_compute(key: str, compute, timeout: int, version=None,
+                   beta: float = 1.0):
+    """Прочитать значение из кэша или пересчитать его в одном воркере.
+
+    В кэше лежит (значение, версия, срок, время пересчета) и живет
+    дольше срока: устаревшее значение отдается, пока блокировку держит
+    другой воркер. Незадолго до срока значение пересчитывается заранее
+    с вероятностью, растущей к сроку (beta=0 отключает это).
+    compute() может вернуть None - тогда ничего не кэшируется.
+    """
+    lock = LOCK_KEY.format(key)
+    entry = cache.get(key)
+    if entry is not None:
+        value, entry_version, expires, delta = entry
+        early = delta * beta * math.log(1 - random.random())
+        if entry_version == version and time.time() - early < expires:
+            return value
+    # снимать блокировку может только тот, кто ее взял
+    locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            return entry[0]
+        deadline = time.time() + LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(LOCK_POLL)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+        # пересчет не закончился вовремя - считаем сами
+
+    try:
+        start = time.time()
+        value = compute()
+        delta = time.time() - start
+        if value is not None:
+            cache.set(
+                key,
+                (value, version, time.time() + timeout, delta),
+                timeout + LOCK_TIMEOUT + delta
+            )
+        return value
+    finally:
+        if locked:
+            cache.delete(lock)
+
+
+def fragment_key(post, links: bool = False) -> str:
+    """Ключ отрисованного поста.
+
+    Меняется вместе с постом (updated) и с тем, что берется из автора
+    и группы, поэтому старые фрагменты не нужно удалять.
+    """
+    version = hashlib.md5(
+        ':'.join((
+            post.updated.isoformat(),
+            post.author.get_full_name(),
+            post.author.username,
+            post.group.slug if post.group_id else '',
+            str(links),
+        )).encode()
+    ).hexdigest()
+    return FRAGMENT_KEY.format(post.pk, version)
+
+
+def _variant(request: HttpRequest, *parts) -> str:
+    # страница зависит от пользователя (шапка, кнопка подписки),
+    # сессионная кука различает пользователей без запроса к базе
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+    return hashlib.md5(
+        ':'.join(map(str, (request.get_full_path(), session) + parts))
+        .encode()
+    ).hexdigest()
+
+
+def page_key(request: HttpRequest, scope: str) -> str:
+    return PAGE_KEY.format(scope, _variant(request))
+
+
+def _feed_etag(request: HttpRequest, name: str, generation: int) -> str:
+    return _variant(request, name, generation)
+
+
+def feed_etag(scope):
+    """etag_func для condition: поколение ленты, без запросов к базе."""
+    def etag(request, *args, **kwargs):
+        name = scope(**kwargs)
+        return _feed_etag(request, name, get_generation(name))
+    return etag
+
+
+def post_etag(request: HttpRequest, post_id: int) -> str:
+    """etag_func для condition: версия поста и его комментариев.
+
+    Все, что меняет страницу поста, читается одним запросом по
+    первичному ключу.
+    """
+    last_comment = Comment.objects.filter(
+        post=OuterRef('pk')
+    ).order_by('-created').values('created')[:1]
+    version = Post.objects.filter(pk=post_id).annotate(
+        last_comment=Subquery(last_comment)
+    ).values_list(
+        'updated', 'comments_count', 'last_comment', 'group__title',
+        'author__first_name', 'author__last_name',
+        'author__profile__posts_count'
+    ).first()
+    if version is None:
+        return None
+    return _variant(request, *version)
+
+
+def cache_feed(scope):
+    """Кэширует страницу ленты до смены поколения ее scope.
+
+    scope получает именованные аргументы представления и
+    возвращает имя ленты. В кэше страница лежит вместе с поколением,
+    для которого собрана: ETag ставится по нему, поэтому прежняя
+    версия, отданная на время чужого пересчета, не получит 304.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            name = scope(**kwargs)
+            generation = get_generation(name)
+            response = None
+
+            def render():
+                nonlocal response
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    return response.content, generation
+                return None
+
+            entry = get_or_compute(
+                page_key(request, name),
+                render,
+                event_timeout(settings.FEED_CACHE_TIMEOUT),
+                version=generation
+            )
+            if response is None:
+                content, generation = entry
+                response = HttpResponse(content)
+            if response.status_code == 200:
+                response['ETag'] = quote_etag(
+                    _feed_etag(request, name, generation)
+                )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,104 @@
+"""Денормализованные счетчики постов, комментариев и подписок.
+
+Счетчики меняются атомарным UPDATE ... SET x = x + 1 из сигналов,
+поэтому учитываются и каскадные удаления. recount() пересчитывает
+все значения заново, если они разошлись с данными. Закэшированные
+группы и пользователи (posts.lookups) сбрасываются вместе со счетчиками.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import lookups
+from .models import Comment, Follow, Group, Post, Profile, User
+
+
+def _change(queryset, field: str, delta: int) -> None:
+    if delta < 0:
+        # не уходим ниже нуля, если счетчик уже разошелся с данными
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_posts(author_id: int, group_id: int = None, delta: int = 1):
+    _change(Profile.objects.filter(pk=author_id), 'posts_count', delta)
+    lookups.users.forget_pk(author_id)
+    if group_id is not None:
+        _change(Group.objects.filter(pk=group_id), 'posts_count', delta)
+        lookups.groups.forget_pk(group_id)
+
+
+def change_group(old_group_id: int, new_group_id: int) -> None:
+    """Пост перенесли в другую группу."""
+    if old_group_id is not None:
+        _change(Group.objects.filter(pk=old_group_id), 'posts_count', -1)
+    if new_group_id is not None:
+        _change(Group.objects.filter(pk=new_group_id), 'posts_count', 1)
+    lookups.groups.forget_pk(old_group_id, new_group_id)
+
+
+def change_author(old_author_id: int, new_author_id: int) -> None:
+    """Посту сменили автора."""
+    if old_author_id is not None:
+        _change(Profile.objects.filter(pk=old_author_id), 'posts_count', -1)
+    _change(Profile.objects.filter(pk=new_author_id), 'posts_count', 1)
+    lookups.users.forget_pk(old_author_id, new_author_id)
+
+
+def change_comments(post_id: int, delta: int = 1) -> None:
+    _change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def change_follows(user_id: int, author_id: int, delta: int = 1) -> None:
+    _change(Profile.objects.filter(pk=user_id), 'following_count', delta)
+    _change(Profile.objects.filter(pk=author_id), 'followers_count', delta)
+    lookups.users.forget_pk(user_id, author_id)
+
+
+def followers_count(author_id: int) -> int:
+    return Profile.objects.filter(pk=author_id).values_list(
+        'followers_count', flat=True
+    ).first() or 0
+
+
+def _count(queryset, field: str):
+    """Подзапрос COUNT по внешнему ключу field для UPDATE."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total')
+        ),
+        Value(0)
+    )
+
+
+def recount() -> dict:
+    """Пересчитать все счетчики заново.
+
+    Возвращает количество обновленных строк по моделям.
+    """
+    Profile.objects.bulk_create(
+        [
+            Profile(user_id=user_id)
+            for user_id in User.objects.filter(
+                profile__isnull=True
+            ).values_list('pk', flat=True)
+        ],
+        ignore_conflicts=True
+    )
+    updated = {
+        'profiles': Profile.objects.update(
+            posts_count=_count(Post.objects.all(), 'author'),
+            followers_count=_count(Follow.objects.all(), 'author'),
+            following_count=_count(Follow.objects.all(), 'user'),
+        ),
+        'groups': Group.objects.update(
+            posts_count=_count(Post.objects.all(), 'group')
+        ),
+        'posts': Post.objects.update(
+            comments_count=_count(Comment.objects.all(), 'post')
+        ),
+    }
+    lookups.users.forget_all()
+    lookups.groups.forget_all()
+    return updated
@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from . import images
 from .models import Comment, Post
 
 
@@ -8,6 +10,25 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._temporary = []
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # уже сохраненная картинка поста приходит как FieldFile
+        if isinstance(image, UploadedFile):
+            normalized = images.normalize(image)
+            self._temporary.append(normalized)
+            return normalized
+        return image
+
+    def close(self) -> None:
+        """Удалить временные файлы картинок; вызывать после save()."""
+        for file in self._temporary:
+            file.close()
+        self._temporary.clear()
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
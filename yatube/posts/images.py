@@ -0,0 +1,123 @@
+"""Подготовка загруженных картинок постов.
+
+Картинка уменьшается до IMAGE_MAX_SIZE по большей стороне, поворачивается
+по EXIF, теряет метаданные и пересохраняется в IMAGE_FORMAT (или в
+JPEG/PNG, если Pillow собран без него). Результат пишется во временный
+файл на диске, а не в память.
+
+Файлы общие для постов с одинаковыми картинками (ContentHashStorage),
+поэтому удаляются через release, когда ссылок на них не осталось.
+"""
+import os
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+from PIL import Image, ImageOps, features
+from sorl.thumbnail import delete
+
+from .models import Post
+
+# формат Pillow: (расширение, content type, опции сохранения)
+FORMATS = {
+    'WEBP': ('webp', 'image/webp', {'method': 6}),
+    'JPEG': ('jpg', 'image/jpeg', {'optimize': True, 'progressive': True}),
+    'PNG': ('png', 'image/png', {'optimize': True}),
+}
+
+
+def has_alpha(image: Image.Image) -> bool:
+    return (image.mode in ('RGBA', 'LA', 'PA')
+            or 'transparency' in image.info)
+
+
+def output_format(image: Image.Image) -> str:
+    if settings.IMAGE_FORMAT == 'WEBP' and features.check('webp'):
+        return 'WEBP'
+    # JPEG не умеет прозрачность
+    return 'PNG' if has_alpha(image) else 'JPEG'
+
+
+def normalize(upload) -> TemporaryUploadedFile:
+    """Уменьшить и пересохранить загруженную картинку.
+
+    Обрезанный или слишком большой в пикселях файл - ValidationError.
+    """
+    max_size = (settings.IMAGE_MAX_SIZE, settings.IMAGE_MAX_SIZE)
+    upload.seek(0)
+    try:
+        with Image.open(upload) as source:
+            # JPEG сразу декодируется в уменьшенном масштабе
+            source.draft('RGB', max_size)
+            image = ImageOps.exif_transpose(source)
+            image.thumbnail(max_size, Image.LANCZOS)
+    except (OSError, Image.DecompressionBombError) as error:
+        raise ValidationError(
+            'Не удалось прочитать изображение: файл поврежден '
+            'или слишком велик.',
+            code='invalid_image'
+        ) from error
+
+    image_format = output_format(image)
+    extension, content_type, options = FORMATS[image_format]
+    image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+    # без exif, icc и прочих метаданных исходника
+    image.info = {}
+
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    result = TemporaryUploadedFile(
+        f'{stem}.{extension}', content_type, 0, None
+    )
+    image.save(
+        result, image_format, quality=settings.IMAGE_QUALITY, **options
+    )
+    result.size = result.tell()
+    result.seek(0)
+    return result
+
+
+def _storage():
+    return Post._meta.get_field('image').storage
+
+
+def release(name: str) -> bool:
+    """Удалить картинку и ее миниатюры, если ни один пост ее не использует.
+
+    Возвращает True, если файл удален.
+    """
+    if not name:
+        return False
+    with _storage().lock():
+        if Post.objects.filter(image=name).exists():
+            return False
+        try:
+            delete(Post(image=name).image)
+        except SuspiciousFileOperation:
+            # путь вне MEDIA_ROOT - файл не из хранилища постов
+            return False
+    return True
+
+
+def keep(name: str, content) -> bool:
+    """Записать заново файл закоммиченного поста, если release его удалил.
+
+    Возвращает True, если файл пришлось записать.
+    """
+    storage = _storage()
+    with storage.lock():
+        if storage.exists(name) or content.closed:
+            return False
+        content.seek(0)
+        storage.save(name, content)
+    return True
+
+
+def keep_on_commit(name: str, content) -> None:
+    # после коммита release видит пост и файл больше не тронет
+    transaction.on_commit(lambda: keep(name, content))
+
+
+def release_on_commit(name: str) -> None:
+    # до коммита ссылка еще может вернуться, например при откате
+    transaction.on_commit(lambda: release(name))
@@ -0,0 +1,225 @@
+"""Кэш групп и пользователей по slug и username и подписок читателей.
+
+Ленты и подписки начинаются с поиска одних и тех же строк. Lookup
+смотрит сначала в LRU процесса, затем в кэш Django (CACHES) и только
+потом в базу. Сохранение и удаление объектов и изменения их счетчиков
+сбрасывают записи явно, LRU других процессов догоняет их не позже
+чем через LOOKUP_LOCAL_TIMEOUT секунд.
+
+Подписки хранятся в кэше Django как множество id авторов на читателя
+и сбрасываются сигналами Follow.
+
+Сброс виден всем воркерам, только если кэш Django общий. Кэш в памяти
+процесса (LocMemCache) держит записи не дольше LOCAL_CACHE_TIMEOUT
+(core.backends.event_timeout), а не LOOKUP_TIMEOUT.
+
+Внутри транзакции кэш не используется: прочитанные в ней строки
+могут откатиться, а ее собственные изменения кэш еще не видел.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import Http404
+
+from core.backends import event_timeout
+
+from .models import Follow, Group, User
+
+KEY = 'lookup:{}:{}'
+PK_KEY = 'lookup:{}:pk:{}'
+FOLLOWS_KEY = 'lookup:follows:{}'
+BATCH_SIZE = 1000
+
+
+class LRU:
+    """Потокобезопасный LRU со сроком жизни записей."""
+
+    def __init__(self):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout: float, size: int) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > size:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_where(self, test) -> None:
+        with self._lock:
+            for key in [
+                key for key, (value, _) in self._data.items() if test(value)
+            ]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class Lookup:
+    """Объекты модели по уникальному полю через два уровня кэша.
+
+    stats считает попадания в LRU (local), в общий кэш (shared)
+    и походы в базу (miss) с момента запуска процесса.
+    """
+
+    def __init__(self, name: str, queryset, field: str):
+        self.name = name
+        self.queryset = queryset
+        self.field = field
+        self.local = LRU()
+        self.stats = {'local': 0, 'shared': 0, 'miss': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def _fetch(self, value):
+        return self.queryset.filter(**{self.field: value}).first()
+
+    def get(self, value):
+        """Объект по значению поля или None."""
+        if connection.in_atomic_block:
+            return self._fetch(value)
+        key = KEY.format(self.name, value)
+        obj = self.local.get(key)
+        if obj is not None:
+            self._count('local')
+            return obj
+
+        obj = cache.get(key)
+        if obj is not None:
+            self._count('shared')
+        else:
+            self._count('miss')
+            obj = self._fetch(value)
+            if obj is None:
+                return None
+            cache.set_many(
+                {key: obj, PK_KEY.format(self.name, obj.pk): value},
+                event_timeout(settings.LOOKUP_TIMEOUT)
+            )
+        self.local.set(
+            key, obj, settings.LOOKUP_LOCAL_TIMEOUT, settings.LOOKUP_LOCAL_SIZE
+        )
+        return obj
+
+    def get_or_404(self, value):
+        obj = self.get(value)
+        if obj is None:
+            raise Http404(
+                f'No {self.queryset.model._meta.object_name} '
+                'matches the given query.'
+            )
+        return obj
+
+    def _delete(self, values) -> None:
+        keys = [KEY.format(self.name, value) for value in values]
+        self.local.delete(*keys)
+        cache.delete_many(keys)
+
+    def forget(self, *values) -> None:
+        """Сбросить записи по значениям поля."""
+        values = [value for value in values if value]
+        if not values:
+            return
+        self._delete(values)
+        if connection.in_atomic_block:
+            # до фиксации другой воркер мог снова прочитать старую строку
+            transaction.on_commit(lambda: self._delete(values))
+
+    def forget_pk(self, *pks) -> None:
+        """Сбросить записи по первичным ключам (например, из счетчиков)."""
+        pks = {pk for pk in pks if pk is not None}
+        if not pks:
+            return
+        self.local.delete_where(lambda obj: obj.pk in pks)
+        values = cache.get_many(
+            [PK_KEY.format(self.name, pk) for pk in pks]
+        ).values()
+        self.forget(*values)
+
+    def forget_all(self) -> None:
+        """Сбросить все записи, например после пересчета счетчиков."""
+        self.local.clear()
+        values = []
+        for value in self.queryset.values_list(
+                self.field, flat=True).iterator():
+            values.append(value)
+            if len(values) == BATCH_SIZE:
+                self.forget(*values)
+                values = []
+        self.forget(*values)
+
+
+groups = Lookup('group', Group.objects.all(), 'slug')
+users = Lookup('user', User.objects.select_related('profile'), 'username')
+
+follow_stats = {'shared': 0, 'miss': 0}
+_follow_lock = threading.Lock()
+
+
+def _fetch_followed(user_id: int) -> frozenset:
+    return frozenset(
+        Follow.objects.filter(user_id=user_id).values_list(
+            'author_id', flat=True
+        )
+    )
+
+
+def followed_ids(user_id: int) -> frozenset:
+    """Id авторов, на которых подписан читатель."""
+    if connection.in_atomic_block:
+        return _fetch_followed(user_id)
+    key = FOLLOWS_KEY.format(user_id)
+    ids = cache.get(key)
+    outcome = 'miss' if ids is None else 'shared'
+    with _follow_lock:
+        follow_stats[outcome] += 1
+    if ids is None:
+        ids = _fetch_followed(user_id)
+        cache.set(key, ids, event_timeout(settings.LOOKUP_TIMEOUT))
+    return ids
+
+
+def is_following(user, author) -> bool:
+    return user.is_authenticated and author.pk in followed_ids(user.pk)
+
+
+def forget_follows(*user_ids) -> None:
+    keys = [FOLLOWS_KEY.format(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def stats() -> dict:
+    result = {lookup.name: dict(lookup.stats) for lookup in (groups, users)}
+    result['follows'] = dict(follow_stats)
+    return result
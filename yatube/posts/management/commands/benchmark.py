@@ -0,0 +1,225 @@
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment,
+    teardown_databases, teardown_test_environment
+)
+
+from posts import benchmark, seeding
+from posts.models import Comment, Follow, Group, Post, User
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def _sqlite_settings() -> dict:
+    if connection.vendor != 'sqlite':
+        return {}
+    values = {}
+    with connection.cursor() as cursor:
+        for name in settings.SQLITE_PRAGMAS:
+            # у базы в памяти часть PRAGMA пустые
+            row = cursor.execute(f'PRAGMA {name}').fetchone()
+            values[name] = row[0] if row else None
+    return values
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет тестовую базу синтетическими данными и замеряет '
+        'представления posts: время ответа, перцентили, число '
+        'SQL-запросов. Результат - JSON для сравнения коммитов'
+    )
+
+    def add_arguments(self, parser):
+        sizes = parser.add_argument_group('объем данных')
+        sizes.add_argument('--users', type=int, default=1000)
+        sizes.add_argument('--groups', type=int, default=20)
+        sizes.add_argument('--posts', type=int, default=20000)
+        sizes.add_argument('--comments', type=int, default=20000)
+        sizes.add_argument(
+            '--follows', type=int, default=20,
+            help='Подписок на читателя в среднем'
+        )
+        sizes.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель Ципфа для популярности авторов и постов'
+        )
+        sizes.add_argument('--seed', type=int, default=0)
+
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом'
+        )
+        parser.add_argument(
+            '--only', nargs='+', help='Прогнать только эти сценарии'
+        )
+        parser.add_argument(
+            '--output', help='Файл для JSON, по умолчанию stdout'
+        )
+        parser.add_argument(
+            '--compare', help='JSON прежнего прогона для сравнения'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимое ухудшение времени при сравнении (доля)'
+        )
+
+        load = parser.add_argument_group(
+            'конкурентная нагрузка (после прогона сценариев)'
+        )
+        load.add_argument(
+            '--readers', type=int, default=0,
+            help='Потоков-читателей, 0 - не запускать'
+        )
+        load.add_argument('--writers', type=int, default=2)
+        load.add_argument(
+            '--duration', type=float, default=10, help='Секунд нагрузки'
+        )
+        load.add_argument(
+            '--sqlite-defaults', action='store_true',
+            help='Журнал и PRAGMA SQLite по умолчанию вместо SQLITE_PRAGMAS'
+        )
+
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять тестовую базу и не заполнять ее повторно'
+        )
+        parser.add_argument(
+            '--in-place', action='store_true',
+            help='Работать в текущей базе вместо тестовой (она меняется)'
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)['results']
+
+        try:
+            setup_test_environment(debug=False)
+            environment = True
+        except RuntimeError:
+            # уже внутри тестов
+            environment = False
+        old_config = self.setup_databases(options)
+        pragmas = settings.SQLITE_PRAGMAS
+        if options['sqlite_defaults']:
+            # журнал WAL записан в файле базы, его надо вернуть явно
+            pragmas = {'journal_mode': 'delete'}
+        try:
+            with override_settings(SQLITE_PRAGMAS=pragmas):
+                if options['sqlite_defaults']:
+                    # PRAGMA действуют на новые соединения
+                    connections.close_all()
+                report = self.run(options)
+        finally:
+            if old_config is not None:
+                teardown_databases(
+                    old_config, verbosity=0, keepdb=options['keepdb']
+                )
+            if environment:
+                teardown_test_environment()
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+        if baseline is not None:
+            self.report_comparison(report['results'], baseline, options)
+
+    def setup_databases(self, options):
+        if options['in_place']:
+            return None
+        if options['readers'] and connection.vendor == 'sqlite':
+            # у потоков должна быть общая файловая база, а не база в памяти
+            connection.settings_dict['TEST']['NAME'] = (
+                connection.settings_dict['TEST']['NAME']
+                or os.path.join(tempfile.gettempdir(), 'yatube_benchmark.db')
+            )
+        return setup_databases(
+            verbosity=0, interactive=False, keepdb=options['keepdb']
+        )
+
+    def run(self, options) -> dict:
+        if not (options['keepdb'] and Post.objects.exists()):
+            start = time.perf_counter()
+            seeding.seed(
+                options['users'], options['groups'], options['posts'],
+                options['comments'], options['follows'],
+                seed=options['seed'], skew=options['skew']
+            )
+            self.stderr.write(
+                f'База заполнена за {time.perf_counter() - start:.1f} с'
+            )
+
+        rows = {
+            model.__name__.lower(): model.objects.count()
+            for model in (User, Group, Post, Comment, Follow)
+        }
+        results = benchmark.run(
+            options['requests'], options['warmup'], options['cold'],
+            options['only']
+        )
+        if not results:
+            raise CommandError('В базе нет данных для сценариев')
+        load = None
+        if options['readers']:
+            load = benchmark.concurrency(
+                options['readers'], options['writers'],
+                options['duration'], options['cold']
+            )
+        return {
+            'meta': {
+                'commit': _commit(),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'options': {
+                    name: options[name] for name in (
+                        'users', 'groups', 'posts', 'comments', 'follows',
+                        'skew', 'seed', 'requests', 'warmup', 'cold',
+                        'readers', 'writers', 'duration',
+                    )
+                },
+                'sqlite': _sqlite_settings(),
+                'rows': rows,
+            },
+            'results': results,
+            'concurrency': load,
+        }
+
+    def report_comparison(self, results, baseline, options):
+        regressions = 0
+        for name, metric, before, after, worse in benchmark.compare(
+                results, baseline, options['threshold']):
+            line = f'{name:14} {metric:13} {before:>10} -> {after:<10}'
+            if worse:
+                regressions += 1
+                self.stderr.write(self.style.ERROR(f'{line} регрессия'))
+            else:
+                self.stderr.write(line)
+        if regressions:
+            raise CommandError(f'Регрессий: {regressions}')
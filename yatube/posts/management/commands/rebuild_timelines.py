@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import timeline
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок (TimelineEntry) с нуля'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Пересобрать ленту только одного пользователя (username)'
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(
+                    f'Пользователь {options["user"]} не найден'
+                )
+
+        with transaction.atomic():
+            count = timeline.rebuild(user)
+        self.stdout.write(
+            self.style.SUCCESS(f'Ленты пересобраны, подписок: {count}')
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счетчики постов, комментариев '
+        'и подписок'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = counters.recount()
+        for model, count in updated.items():
+            self.stdout.write(f'{model}: {count}')
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны'))
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        'Быстро заполняет базу синтетическими пользователями, группами, '
+        'постами, комментариями и подписками (bulk_create пачками, '
+        'индексы строятся после загрузки)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Подписок на читателя в среднем'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель Ципфа для авторов постов и комментируемых постов'
+        )
+        parser.add_argument(
+            '--follow-skew', type=float,
+            help='Показатель Ципфа для подписчиков авторов, по умолчанию '
+                 'как --skew'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='На сколько дней назад растянуть даты постов'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        start = last = time.perf_counter()
+
+        def progress(stage, count):
+            nonlocal last
+            now = time.perf_counter()
+            done = '' if count is None else f' {count}'
+            self.stdout.write(f'{stage}:{done} ({now - last:.1f} с)')
+            last = now
+
+        seeding.seed(
+            options['users'], options['groups'], options['posts'],
+            options['comments'], options['follows'],
+            seed=options['seed'], skew=options['skew'],
+            follow_skew=options['follow_skew'], days=options['days'],
+            progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'База заполнена за {time.perf_counter() - start:.1f} с'
+        ))
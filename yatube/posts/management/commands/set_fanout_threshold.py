@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Меняет порог подписчиков, с которого посты автора подмешиваются '
+        'в ленты при чтении, и переносит затронутых авторов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'threshold',
+            nargs='?',
+            type=int,
+            help='Новый порог; без аргумента печатает текущий'
+        )
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help='Перенести авторов по текущему порогу (для расписания)'
+        )
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        if threshold is None and options['sync']:
+            with transaction.atomic():
+                count = timeline.sync_authors()
+            self.stdout.write(self.style.SUCCESS(
+                f'Проверено авторов: {count}'
+            ))
+            return
+        if threshold is None:
+            self.stdout.write(str(timeline.get_threshold()))
+            return
+
+        with transaction.atomic():
+            count = timeline.set_threshold(threshold)
+        self.stdout.write(self.style.SUCCESS(
+            f'Порог {threshold}, проверено авторов: {count}'
+        ))
@@ -0,0 +1,94 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def _warm(name: str) -> tuple:
+    """Нарезать миниатюры одной картинки в процессе пула."""
+    try:
+        return name, thumbnails.render(Post(image=name).image), None
+    except Exception as error:
+        return name, False, f'{type(error).__name__}: {error}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Заранее нарезает миниатюры всех картинок постов. Готовые '
+        'миниатюры пропускаются, поэтому прерванный прогон можно '
+        'просто запустить снова'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Процессов в пуле, 0 - резать в текущем процессе'
+        )
+        parser.add_argument(
+            '--chunksize', type=int, default=8,
+            help='Сколько картинок отдавать процессу за раз'
+        )
+        parser.add_argument(
+            '--progress', type=int, default=100,
+            help='Печатать прогресс каждые N картинок'
+        )
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct()
+        todo = [
+            name for name in names.iterator()
+            if not thumbnails.is_ready(Post(image=name).image)
+        ]
+        skipped = names.count() - len(todo)
+        self.stdout.write(
+            f'Картинок: {len(todo) + skipped}, готовы: {skipped}, '
+            f'к нарезке: {len(todo)}'
+        )
+        if not todo:
+            return
+
+        if options['workers']:
+            # процессы пула не должны делить соединения с родителем
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=options['workers'])
+            results = executor.map(
+                _warm, todo, chunksize=options['chunksize']
+            )
+        else:
+            executor = None
+            results = map(_warm, todo)
+
+        done = failed = 0
+        start = time.monotonic()
+        try:
+            for done, (name, created, error) in enumerate(results, 1):
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                elif created:
+                    thumbnails.touch(name)
+                if done % options['progress'] == 0 or done == len(todo):
+                    self.report(done, len(todo), start)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Нарезано: {done - failed}, ошибок: {failed}'
+        ))
+
+    def report(self, done: int, total: int, start: float) -> None:
+        elapsed = time.monotonic() - start
+        rate = done / elapsed if elapsed else 0
+        left = (total - done) / rate if rate else 0
+        self.stdout.write(
+            f'{done}/{total} ({done * 100 // total}%), '
+            f'{rate:.1f} картинок/с, осталось ~{left:.0f} с'
+        )
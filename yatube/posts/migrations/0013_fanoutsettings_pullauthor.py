@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_auto_20261018_0201'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FanoutSettings',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('threshold', models.PositiveIntegerField(help_text='Начиная с этого числа подписчиков посты автора читаются из ленты при показе, а не раскладываются заранее', verbose_name='Порог подписчиков')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PullAuthor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.OneToOneField(help_text='Популярный автор, посты подмешиваются при чтении ленты', on_delete=django.db.models.deletion.CASCADE, related_name='pull_side', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+        ),
+    ]
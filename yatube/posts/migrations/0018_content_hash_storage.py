@@ -0,0 +1,19 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:19
+
+from django.db import migrations, models
+import posts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_image_size'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, help_text='Выберите изображение для загрузки', storage=posts.storage.ContentHashStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+    ]
@@ -0,0 +1,205 @@
+import re
+from itertools import islice
+
+from django.db import migrations
+
+TABLE = 'posts_search'
+COMMENTS_TABLE = 'posts_comment_search'
+TOKENIZE = "tokenize='unicode61 remove_diacritics 2'"
+BATCH_SIZE = 500
+
+# Копия стеммера из posts.search на момент миграции: правки модуля
+# не должны менять то, что миграция пишет в индекс.
+WORD = re.compile(r'\w+')
+CYRILLIC = re.compile(r'[а-я]')
+
+VOWELS = 'аеиоуыэюя'
+
+
+def _endings(after_a=(), other=()) -> list:
+    """Окончания от длинных к коротким; after_a - только после а/я."""
+    endings = [(ending, True) for ending in after_a]
+    endings += [(ending, False) for ending in other]
+    return sorted(endings, key=lambda item: len(item[0]), reverse=True)
+
+
+PERFECTIVE_GERUND = _endings(
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = _endings(other=(
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею',
+))
+PARTICIPLE = _endings(('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = _endings(other=('ся', 'сь'))
+VERB = _endings(
+    (
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+    ),
+    (
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+        'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+        'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    ),
+)
+NOUN = _endings(other=(
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+    'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+    'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я',
+))
+DERIVATIONAL = _endings(other=('ост', 'ость'))
+SUPERLATIVE = _endings(other=('ейш', 'ейше'))
+
+
+def _cut(word: str, endings: list):
+    """Слово без самого длинного окончания из списка или None."""
+    for ending, after_a in endings:
+        if word.endswith(ending):
+            base = word[:-len(ending)]
+            if after_a and not base.endswith(('а', 'я')):
+                return None
+            return base
+    return None
+
+
+def _regions(word: str) -> tuple:
+    """Начала областей RV и R2 алгоритма Snowball."""
+    rv = r1 = r2 = len(word)
+    for i, letter in enumerate(word):
+        if letter in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip_ending(tail: str) -> str:
+    """Шаг 1: деепричастие, прилагательное, глагол или существительное."""
+    base = _cut(tail, PERFECTIVE_GERUND)
+    if base is not None:
+        return base
+    reflexive = _cut(tail, REFLEXIVE)
+    if reflexive is not None:
+        tail = reflexive
+    base = _cut(tail, ADJECTIVE)
+    if base is not None:
+        participle = _cut(base, PARTICIPLE)
+        return base if participle is None else participle
+    for endings in (VERB, NOUN):
+        base = _cut(tail, endings)
+        if base is not None:
+            return base
+    return tail
+
+
+def _tidy_up(tail: str) -> str:
+    """Шаг 4: нн, превосходная степень и мягкий знак."""
+    if tail.endswith('нн'):
+        return tail[:-1]
+    base = _cut(tail, SUPERLATIVE)
+    if base is not None:
+        return base[:-1] if base.endswith('нн') else base
+    return tail[:-1] if tail.endswith('ь') else tail
+
+
+def stem(word: str) -> str:
+    """Основа русского слова по алгоритму Snowball."""
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+    head, tail = word[:rv], _strip_ending(word[rv:])
+
+    if tail.endswith('и'):
+        tail = tail[:-1]
+
+    base = _cut(tail, DERIVATIONAL)
+    if base is not None and rv + len(base) >= r2:
+        tail = base
+    return head + _tidy_up(tail)
+
+
+def tokenize(text: str) -> list:
+    """Основы слов текста; слова не на кириллице только в нижнем регистре."""
+    tokens = []
+    for word in WORD.findall(text.lower()):
+        tokens.append(stem(word) if CYRILLIC.search(word) else word)
+    return tokens
+
+
+def normalize(text: str) -> str:
+    return ' '.join(tokenize(text))
+
+
+def create_search_index(apps, schema_editor):
+    """Посты и комментарии - строки двух таблиц FTS5."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE {TABLE} USING fts5(text, {TOKENIZE})'
+        )
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE {COMMENTS_TABLE} USING fts5('
+            f'text, post_id UNINDEXED, {TOKENIZE})'
+        )
+        _insert(
+            cursor, TABLE, ('text',),
+            (
+                (post_id, normalize(text))
+                for post_id, text in Post.objects.values_list(
+                    'id', 'text'
+                ).iterator()
+            )
+        )
+        _insert(
+            cursor, COMMENTS_TABLE, ('text', 'post_id'),
+            (
+                (comment_id, normalize(text), post_id)
+                for comment_id, text, post_id in Comment.objects.values_list(
+                    'id', 'text', 'post_id'
+                ).iterator()
+            )
+        )
+
+
+def _insert(cursor, table: str, columns: tuple, rows) -> None:
+    """Вставить строки (rowid, *columns) пачками по BATCH_SIZE."""
+    sql = (
+        f'INSERT INTO {table} (rowid, {", ".join(columns)}) '
+        f'VALUES ({", ".join(["%s"] * (len(columns) + 1))})'
+    )
+    rows = iter(rows)
+    batch = list(islice(rows, BATCH_SIZE))
+    while batch:
+        cursor.executemany(sql, batch)
+        batch = list(islice(rows, BATCH_SIZE))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {COMMENTS_TABLE}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_content_hash_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -2,6 +2,8 @@ from django.contrib.auth import get_user_model
 from django.db import models
 from django.db.models import UniqueConstraint
 
+from .storage import ContentHashStorage
+
 User = get_user_model()
 
 
@@ -9,6 +11,11 @@ class Group(models.Model):
     title = models.CharField(verbose_name='Имя', max_length=200)
     slug = models.SlugField(verbose_name='Идентификатор', unique=True)
     description = models.TextField(verbose_name='Описание')
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Количество постов',
+        default=0,
+        editable=False
+    )
 
     def __str__(self) -> str:
         return self.title
@@ -24,6 +31,10 @@ class Post(models.Model):
         auto_now_add=True,
         help_text='Дата публикации'
     )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
@@ -43,12 +54,45 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=ContentHashStorage(),
         blank=True,
+        db_index=True,
         help_text='Выберите изображение для загрузки'
     )
+    # размеры картинки, чтобы шаблонам не открывать файл
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина картинки',
+        null=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота картинки',
+        null=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Количество комментариев',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ['-pub_date']
+        # по индексу на каждую ленту: главная, профиль, группа
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
@@ -81,6 +125,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx'
+            )
+        ]
 
 
 class Follow(models.Model):
@@ -103,3 +153,87 @@ class Follow(models.Model):
         constraints = [
             UniqueConstraint(fields=['user', 'author'], name='unique follow')
         ]
+
+
+class Profile(models.Model):
+    """Счетчики пользователя, поддерживаются сигналами."""
+
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='profile'
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Количество постов',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Количество подписок',
+        default=0
+    )
+
+    def __str__(self) -> str:
+        return str(self.user)
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        verbose_name='Читатель',
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        help_text='Владелец ленты'
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        help_text='Пост в ленте'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+        help_text='Копия даты публикации поста для сортировки ленты'
+    )
+
+    class Meta:
+        ordering = ['-pub_date']
+        constraints = [
+            UniqueConstraint(fields=['user', 'post'], name='unique timeline')
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx'
+            )
+        ]
+
+
+class PullAuthor(models.Model):
+    """Автор, чьи посты не раскладываются по лентам при публикации."""
+
+    author = models.OneToOneField(
+        User,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='pull_side',
+        help_text='Популярный автор, посты подмешиваются при чтении ленты'
+    )
+
+
+class FanoutSettings(models.Model):
+    """Настройки раскладки ленты, одна строка с pk=1."""
+
+    threshold = models.PositiveIntegerField(
+        verbose_name='Порог подписчиков',
+        help_text=(
+            'Начиная с этого числа подписчиков посты автора '
+            'читаются из ленты при показе, а не раскладываются заранее'
+        )
+    )
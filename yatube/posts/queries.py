@@ -0,0 +1,42 @@
+"""Запросы для страниц постов.
+
+Каждая функция возвращает queryset, которого шаблону страницы
+хватает целиком: все связанные объекты, которые он читает,
+загружены тем же запросом.
+"""
+from django.db.models import QuerySet
+
+from . import timeline
+from .models import Group, Post, User
+from .utils import MergedFeed
+
+
+def post_detail() -> QuerySet:
+    """Пост с автором, его счетчиками и группой одним запросом."""
+    return Post.objects.select_related('author__profile', 'group')
+
+
+def post_comments(post: Post) -> QuerySet:
+    """Комментарии поста вместе с авторами."""
+    return post.comments.select_related('author')
+
+
+def feed() -> QuerySet:
+    """Посты ленты вместе с автором и группой для includes/article.html."""
+    return Post.objects.select_related('author', 'group')
+
+
+def index_feed() -> QuerySet:
+    return feed()
+
+
+def group_feed(group: Group) -> QuerySet:
+    return feed().filter(group=group)
+
+
+def profile_feed(author: User) -> QuerySet:
+    return feed().filter(author=author)
+
+
+def follow_feed(user: User) -> MergedFeed:
+    return timeline.feed(user)
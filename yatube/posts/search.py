@@ -0,0 +1,336 @@
+"""Полнотекстовый поиск по постам и комментариям.
+
+Индекс - две виртуальные таблицы SQLite FTS5: posts_search с rowid
+поста и posts_comment_search с rowid комментария и id его поста.
+В индекс пишутся не исходные тексты, а основы слов (стеммер Snowball
+для русского), и запрос приводится к основам тем же способом, поэтому
+"котами" находит "кот". Каждый пост и каждый комментарий - своя
+строка, поэтому сигналы сохранения и удаления переписывают только ее;
+rebuild() собирает индекс заново.
+
+На других базах поиск деградирует до icontains по тексту поста.
+"""
+import re
+from functools import lru_cache
+from itertools import islice
+
+from django.db import connection
+
+from .models import Comment, Post
+
+TABLE = 'posts_search'
+COMMENTS_TABLE = 'posts_comment_search'
+# множители bm25 поста и комментария: совпадение в тексте поста важнее
+WEIGHTS = (1.0, 0.3)
+MAX_RESULTS = 1000
+BATCH_SIZE = 500
+# словарь живого текста невелик: основы слов считаются один раз
+STEM_CACHE_SIZE = 50000
+
+WORD = re.compile(r'\w+')
+CYRILLIC = re.compile(r'[а-я]')
+
+VOWELS = 'аеиоуыэюя'
+
+
+def _endings(after_a=(), other=()) -> list:
+    """Окончания от длинных к коротким; after_a - только после а/я."""
+    endings = [(ending, True) for ending in after_a]
+    endings += [(ending, False) for ending in other]
+    return sorted(endings, key=lambda item: len(item[0]), reverse=True)
+
+
+PERFECTIVE_GERUND = _endings(
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = _endings(other=(
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею',
+))
+PARTICIPLE = _endings(('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+REFLEXIVE = _endings(other=('ся', 'сь'))
+VERB = _endings(
+    (
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+    ),
+    (
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+        'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+        'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    ),
+)
+NOUN = _endings(other=(
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+    'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+    'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я',
+))
+DERIVATIONAL = _endings(other=('ост', 'ость'))
+SUPERLATIVE = _endings(other=('ейш', 'ейше'))
+
+
+def _cut(word: str, endings: list):
+    """Слово без самого длинного окончания из списка или None."""
+    for ending, after_a in endings:
+        if word.endswith(ending):
+            base = word[:-len(ending)]
+            if after_a and not base.endswith(('а', 'я')):
+                return None
+            return base
+    return None
+
+
+def _regions(word: str) -> tuple:
+    """Начала областей RV и R2 алгоритма Snowball."""
+    rv = r1 = r2 = len(word)
+    for i, letter in enumerate(word):
+        if letter in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip_ending(tail: str) -> str:
+    """Шаг 1: деепричастие, прилагательное, глагол или существительное."""
+    base = _cut(tail, PERFECTIVE_GERUND)
+    if base is not None:
+        return base
+    reflexive = _cut(tail, REFLEXIVE)
+    if reflexive is not None:
+        tail = reflexive
+    base = _cut(tail, ADJECTIVE)
+    if base is not None:
+        participle = _cut(base, PARTICIPLE)
+        return base if participle is None else participle
+    for endings in (VERB, NOUN):
+        base = _cut(tail, endings)
+        if base is not None:
+            return base
+    return tail
+
+
+def _tidy_up(tail: str) -> str:
+    """Шаг 4: нн, превосходная степень и мягкий знак."""
+    if tail.endswith('нн'):
+        return tail[:-1]
+    base = _cut(tail, SUPERLATIVE)
+    if base is not None:
+        return base[:-1] if base.endswith('нн') else base
+    return tail[:-1] if tail.endswith('ь') else tail
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word: str) -> str:
+    """Основа русского слова по алгоритму Snowball."""
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+    head, tail = word[:rv], _strip_ending(word[rv:])
+
+    if tail.endswith('и'):
+        tail = tail[:-1]
+
+    base = _cut(tail, DERIVATIONAL)
+    if base is not None and rv + len(base) >= r2:
+        tail = base
+    return head + _tidy_up(tail)
+
+
+def tokenize(text: str) -> list:
+    """Основы слов текста; слова не на кириллице только в нижнем регистре."""
+    tokens = []
+    for word in WORD.findall(text.lower()):
+        tokens.append(stem(word) if CYRILLIC.search(word) else word)
+    return tokens
+
+
+def normalize(text: str) -> str:
+    return ' '.join(tokenize(text))
+
+
+def build_query(query: str) -> str:
+    """Запрос FTS5: все слова обязательны, последнее - как префикс."""
+    tokens = tokenize(query)
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def enabled() -> bool:
+    return connection.vendor == 'sqlite'
+
+
+def _upsert(cursor, table: str, rowid: int, values: dict) -> None:
+    columns = ', '.join(f'{name} = %s' for name in values)
+    cursor.execute(
+        f'UPDATE {table} SET {columns} WHERE rowid = %s',
+        [*values.values(), rowid]
+    )
+    if cursor.rowcount == 0:
+        cursor.execute(
+            f'INSERT INTO {table} (rowid, {", ".join(values)}) '
+            f'VALUES (%s{", %s" * len(values)})',
+            [rowid, *values.values()]
+        )
+
+
+def index_post(post: Post) -> None:
+    """Добавить или обновить текст поста в индексе."""
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        _upsert(cursor, TABLE, post.pk, {'text': normalize(post.text)})
+
+
+def index_comment(comment: Comment) -> None:
+    """Добавить или обновить комментарий в индексе."""
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        _upsert(cursor, COMMENTS_TABLE, comment.pk, {
+            'text': normalize(comment.text),
+            'post_id': comment.post_id,
+        })
+
+
+def remove_post(post_id: int) -> None:
+    """Убрать из индекса пост вместе с его комментариями.
+
+    Вызывается до удаления, пока комментарии поста еще в базе: их
+    строки удаляются одним запросом, а удаление каждого комментария
+    потом ничего не находит.
+    """
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+        cursor.execute(
+            f'DELETE FROM {COMMENTS_TABLE} WHERE rowid IN '
+            f'(SELECT id FROM {Comment._meta.db_table} WHERE post_id = %s)',
+            [post_id]
+        )
+
+
+def remove_comment(comment_id: int) -> None:
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {COMMENTS_TABLE} WHERE rowid = %s', [comment_id]
+        )
+
+
+def rebuild() -> int:
+    """Собрать индекс заново, возвращает количество постов."""
+    if not enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(f'DELETE FROM {COMMENTS_TABLE}')
+        count = _insert(
+            cursor, TABLE, ('text',),
+            (
+                (post_id, normalize(text))
+                for post_id, text in Post.objects.values_list(
+                    'id', 'text'
+                ).iterator()
+            )
+        )
+        _insert(
+            cursor, COMMENTS_TABLE, ('text', 'post_id'),
+            (
+                (comment_id, normalize(text), post_id)
+                for comment_id, text, post_id in Comment.objects.values_list(
+                    'id', 'text', 'post_id'
+                ).iterator()
+            )
+        )
+    return count
+
+
+def _insert(cursor, table: str, columns: tuple, rows) -> int:
+    """Вставить строки (rowid, *columns) пачками по BATCH_SIZE."""
+    sql = (
+        f'INSERT INTO {table} (rowid, {", ".join(columns)}) '
+        f'VALUES (%s{", %s" * len(columns)})'
+    )
+    count = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return count
+        cursor.executemany(sql, batch)
+        count += len(batch)
+
+
+class SearchResults:
+    """Найденные посты по убыванию релевантности.
+
+    Поддерживает count() и срезы, поэтому подходит для Paginator:
+    посты загружаются только для текущей страницы.
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self._ids = None
+
+    @property
+    def ids(self) -> list:
+        if self._ids is None:
+            self._ids = self._search()
+        return self._ids
+
+    def _search(self) -> list:
+        if not enabled():
+            return list(
+                Post.objects.filter(text__icontains=self.query).values_list(
+                    'id', flat=True
+                )[:MAX_RESULTS]
+            )
+        match = build_query(self.query)
+        if not match:
+            return []
+        # пост находится по своему тексту или по любому комментарию,
+        # оценки bm25 (отрицательные, лучше - меньше) складываются
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT post_id FROM ('
+                f'SELECT rowid AS post_id, bm25({TABLE}) * %s AS score '
+                f'FROM {TABLE} WHERE {TABLE} MATCH %s '
+                'UNION ALL '
+                f'SELECT post_id, bm25({COMMENTS_TABLE}) * %s '
+                f'FROM {COMMENTS_TABLE} WHERE {COMMENTS_TABLE} MATCH %s'
+                ') GROUP BY post_id ORDER BY SUM(score) LIMIT %s',
+                [WEIGHTS[0], match, WEIGHTS[1], match, MAX_RESULTS]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        ids = self.ids[index]
+        posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def search(query: str) -> SearchResults:
+    return SearchResults(query)
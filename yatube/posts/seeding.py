@@ -0,0 +1,263 @@
+"""Синтетические данные для нагрузочных прогонов.
+
+Объекты пишутся bulk_create пачками, каждые CHUNK_SIZE строк - своей
+транзакцией, а составные индексы таблиц на время загрузки снимаются
+и строятся заново одним проходом. Сигналы при этом не срабатывают:
+ленты, счетчики и поисковый индекс собираются в finish().
+
+Популярность распределена по Ципфу: немногие авторы пишут больше
+всех и собирают больше подписчиков, немногие посты собирают большую
+часть комментариев. Даты постов растянуты на days дней назад
+(auto_now_add на время вставки отключается). При одном seed данные
+одинаковы от прогона к прогону.
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from . import counters, search, timeline
+from .models import Comment, Follow, Group, Post, Profile, TimelineEntry, User
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 50000
+USERNAME = 'seed{}'
+DEFERRED = (Post, Comment, TimelineEntry)
+
+# простое число: номер * SCRAMBLE % size переставляет номера постов
+# без таблицы перестановки в памяти
+SCRAMBLE = 2654435761
+
+
+def _last_pk(model) -> int:
+    return model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+@contextmanager
+def historical_dates():
+    """Разрешить задавать даты, которые обычно ставит Django."""
+    fields = [
+        Post._meta.get_field('pub_date'),
+        Post._meta.get_field('updated'),
+        Comment._meta.get_field('created'),
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+@contextmanager
+def deferred_indexes(*models):
+    """Снять составные индексы на время загрузки.
+
+    Внутри транзакции DDL на SQLite недоступна, тогда индексы остаются.
+    """
+    if connection.in_atomic_block:
+        yield
+        return
+    with connection.schema_editor() as editor:
+        for model in models:
+            for index in model._meta.indexes:
+                editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for model in models:
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+
+
+class Seeder:
+    def __init__(self, seed: int = 0, skew: float = 1.1,
+                 follow_skew: float = None, days: int = 365,
+                 locale: str = 'ru_RU'):
+        self.rng = random.Random(seed)
+        self.fake = Faker(locale)
+        self.fake.seed_instance(seed)
+        self.skew = skew
+        self.follow_skew = skew if follow_skew is None else follow_skew
+        self.days = days
+        self.now = timezone.now()
+        # (id новых постов по порядку вставки, дата первого, шаг):
+        # дата поста вычисляется по номеру без выборки из базы
+        self._posts = None
+
+    def _zipf(self, size: int, skew: float) -> int:
+        """Номер 0..size-1 с вероятностью ~ 1 / (номер + 1) ** skew.
+
+        Обратная функция непрерывного степенного распределения:
+        памяти не нужно даже на миллионы номеров.
+        """
+        u = self.rng.random()
+        if abs(skew - 1) < 1e-9:
+            rank = size ** u
+        else:
+            power = 1 - skew
+            rank = ((size ** power - 1) * u + 1) ** (1 / power)
+        return min(int(rank) - 1, size - 1)
+
+    def _create(self, model, objects, **kwargs) -> int:
+        """bulk_create пачками, CHUNK_SIZE строк на транзакцию."""
+        created = 0
+        objects = iter(objects)
+        while True:
+            with transaction.atomic():
+                chunk = 0
+                while chunk < CHUNK_SIZE:
+                    batch = list(islice(objects, BATCH_SIZE))
+                    if not batch:
+                        return created + chunk
+                    model.objects.bulk_create(batch, **kwargs)
+                    chunk += len(batch)
+            created += chunk
+
+    def users(self, count: int) -> list:
+        """Пользователи без пароля (хэширование - самое медленное)."""
+        last = _last_pk(User)
+        self._create(User, (
+            User(
+                username=USERNAME.format(last + i + 1),
+                first_name=self.fake.first_name(),
+                last_name=self.fake.last_name(),
+                password='!'
+            ) for i in range(count)
+        ))
+        ids = list(User.objects.filter(
+            pk__gt=last
+        ).order_by('pk').values_list('pk', flat=True))
+        self._create(
+            Profile, (Profile(user_id=pk) for pk in ids),
+            ignore_conflicts=True
+        )
+        return ids
+
+    def groups(self, count: int) -> list:
+        last = _last_pk(Group)
+        self._create(Group, (
+            Group(
+                title=self.fake.catch_phrase()[:200],
+                slug=f'seed-{last + i + 1}',
+                description=self.fake.paragraph()
+            ) for i in range(count)
+        ))
+        return list(Group.objects.filter(
+            pk__gt=last
+        ).values_list('pk', flat=True))
+
+    def posts(self, count: int, author_ids: list, group_ids: list) -> int:
+        """Посты по возрастанию даты, авторы - по Ципфу."""
+        if not count or not author_ids:
+            return 0
+        start = self.now - timedelta(days=self.days)
+        step = (self.now - start) / count
+        last = _last_pk(Post)
+
+        def build(i: int) -> Post:
+            date = start + step * i
+            return Post(
+                text=self.fake.paragraph(nb_sentences=self.rng.randint(1, 6)),
+                author_id=author_ids[self._zipf(len(author_ids), self.skew)],
+                group_id=(
+                    self.rng.choice(group_ids)
+                    if group_ids and self.rng.random() < 0.5 else None
+                ),
+                pub_date=date,
+                updated=date
+            )
+        created = self._create(Post, (build(i) for i in range(count)))
+        # AUTOINCREMENT не берет id удаленных постов, поэтому id новых
+        # не обязательно идут сразу за прежним максимумом
+        ids = list(Post.objects.filter(
+            pk__gt=last
+        ).order_by('pk').values_list('pk', flat=True))
+        self._posts = (ids, start, step)
+        return created
+
+    def comments(self, count: int, user_ids: list) -> int:
+        """Комментарии к новым постам, не раньше самого поста."""
+        if not count or self._posts is None:
+            return 0
+        ids, start, step = self._posts
+        size = len(ids)
+
+        def build() -> Comment:
+            # популярные посты разбросаны по всей ленте, а не подряд
+            index = self._zipf(size, self.skew) * SCRAMBLE % size
+            posted = start + step * index
+            return Comment(
+                post_id=ids[index],
+                author_id=self.rng.choice(user_ids),
+                text=self.fake.sentence(),
+                created=posted + (self.now - posted) * self.rng.random()
+            )
+        return self._create(Comment, (build() for _ in range(count)))
+
+    def follows(self, user_ids: list, mean: int) -> int:
+        """Подписки: в среднем mean на читателя, авторы - по Ципфу."""
+        def pairs():
+            for user_id in user_ids:
+                wanted = int(self.rng.expovariate(1 / mean)) if mean else 0
+                authors = {
+                    user_ids[self._zipf(len(user_ids), self.follow_skew)]
+                    for _ in range(min(wanted, len(user_ids) - 1))
+                }
+                authors.discard(user_id)
+                for author_id in authors:
+                    yield Follow(user_id=user_id, author_id=author_id)
+        return self._create(Follow, pairs(), ignore_conflicts=True)
+
+
+def finish() -> None:
+    """Собрать то, что обычно ведут сигналы."""
+    counters.recount()
+    # по новым счетчикам популярные авторы уходят на сторону pull;
+    # порог не сохраняется, чтобы не перекрыть FANOUT_THRESHOLD
+    timeline.sync_authors()
+    timeline.rebuild()
+    search.rebuild()
+    cache.clear()
+
+
+def seed(users: int, groups: int, posts: int, comments: int,
+         follows: int, seed: int = 0, skew: float = 1.1,
+         follow_skew: float = None, days: int = 365,
+         progress=None) -> dict:
+    """Заполнить базу и вернуть число созданных объектов.
+
+    progress(этап, число) вызывается после каждого этапа.
+    """
+    seeder = Seeder(seed, skew, follow_skew, days)
+    created = {}
+
+    def stage(name: str, count: int) -> None:
+        created[name] = count
+        if progress:
+            progress(name, count)
+
+    with deferred_indexes(*DEFERRED):
+        user_ids = seeder.users(users)
+        stage('users', len(user_ids))
+        group_ids = seeder.groups(groups)
+        stage('groups', len(group_ids))
+        with historical_dates():
+            stage('posts', seeder.posts(posts, user_ids, group_ids))
+            stage('comments', seeder.comments(comments, user_ids))
+        stage('follows', seeder.follows(user_ids, follows))
+        finish()
+        if progress:
+            progress('derived', None)
+    if progress:
+        progress('indexes', None)
+    return created
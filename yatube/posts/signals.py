@@ -0,0 +1,257 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import (
+    caching, counters, images, lookups, search, thumbnails, timeline
+)
+from .models import Comment, Follow, Group, Post, Profile, User
+
+
+@receiver(post_save, sender=User)
+def create_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)
+
+
+def _only_last_login(update_fields) -> bool:
+    return update_fields is not None and set(update_fields) == {'last_login'}
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, raw=False, update_fields=None,
+                      **kwargs):
+    if instance.pk and not raw and not _only_last_login(update_fields):
+        instance._old_username = User.objects.filter(
+            pk=instance.pk
+        ).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_feeds(sender, instance, raw=False, update_fields=None,
+                          **kwargs):
+    # вход пользователя обновляет только last_login, его не видно в лентах
+    if raw or _only_last_login(update_fields):
+        return
+    scopes = {caching.INDEX, caching.profile_scope(instance.username)}
+    old_username = getattr(instance, '_old_username', None)
+    if old_username:
+        scopes.add(caching.profile_scope(old_username))
+    caching.bump(*scopes)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and not _only_last_login(update_fields):
+        lookups.users.forget(
+            instance.username, getattr(instance, '_old_username', None)
+        )
+
+
+@receiver(pre_save, sender=Group)
+def remember_slug(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._old_slug = Group.objects.filter(
+            pk=instance.pk
+        ).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feeds(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    scopes = {caching.INDEX, caching.group_scope(instance.slug)}
+    old_slug = getattr(instance, '_old_slug', None)
+    if old_slug:
+        scopes.add(caching.group_scope(old_slug))
+    caching.bump(*scopes)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_group(sender, instance, raw=False, **kwargs):
+    if not raw:
+        lookups.groups.forget(
+            instance.slug, getattr(instance, '_old_slug', None)
+        )
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_post(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        (
+            instance._old_author_id,
+            instance._old_group_id,
+            instance._old_image
+        ) = Post.objects.filter(pk=instance.pk).values_list(
+            'author_id', 'group_id', 'image'
+        ).first() or (None, None, '')
+
+
+@receiver(pre_save, sender=Post)
+def remember_image_size(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    image = instance.image
+    if not image:
+        instance.image_width = instance.image_height = None
+    elif not image._committed or instance.image_width is None:
+        # новая загрузка еще в памяти или во временном файле
+        try:
+            instance.image_width = image.width
+            instance.image_height = image.height
+        except (OSError, SuspiciousFileOperation):
+            # файла нет или путь вне MEDIA_ROOT - размер неизвестен
+            pass
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.change_posts(instance.author_id, instance.group_id)
+        return
+    if instance._old_group_id != instance.group_id:
+        counters.change_group(instance._old_group_id, instance.group_id)
+    if instance._old_author_id != instance.author_id:
+        counters.change_author(instance._old_author_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.change_posts(instance.author_id, instance.group_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_feeds(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.bump(*caching.post_scopes(
+            instance, getattr(instance, '_old_group_id', None)
+        ))
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_feeds(sender, instance, **kwargs):
+    caching.bump(*caching.post_scopes(instance))
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_image_content(sender, instance, raw=False, **kwargs):
+    image = instance.image
+    instance._image_content = (
+        image.file if image and not image._committed and not raw else None
+    )
+
+
+@receiver(post_save, sender=Post)
+def keep_new_image(sender, instance, raw=False, **kwargs):
+    # до миниатюр: им нужен файл на месте
+    content = getattr(instance, '_image_content', None)
+    if content is not None and not raw:
+        images.keep_on_commit(instance.image.name, content)
+
+
+@receiver(post_save, sender=Post)
+def schedule_thumbnails(sender, instance, raw=False, **kwargs):
+    if instance.image and not raw:
+        thumbnails.schedule_on_commit(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, created, raw=False, **kwargs):
+    old_image = getattr(instance, '_old_image', '')
+    if not created and not raw and old_image != instance.image.name:
+        images.release_on_commit(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    images.release_on_commit(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_post(instance)
+
+
+# до удаления: комментарии поста еще в базе и убираются из индекса разом
+@receiver(pre_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_comments(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.change_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    search.remove_comment(instance.pk)
+
+
+# счетчики подписок обновляются раньше ленты: от них зависит,
+# раскладывать ли посты автора по лентам
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_follows(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    counters.change_follows(instance.user_id, instance.author_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def forget_follows(sender, instance, raw=False, **kwargs):
+    if not raw:
+        lookups.forget_follows(instance.user_id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.unfollow(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feeds(sender, instance, raw=False, **kwargs):
+    # счетчики подписок и кнопка "Подписаться" в профилях
+    if not raw:
+        caching.bump(
+            caching.profile_scope(instance.user.username),
+            caching.profile_scope(instance.author.username)
+        )
@@ -0,0 +1,60 @@
+import hashlib
+import os
+from contextlib import contextmanager
+
+from django.core.files import File, locks
+from django.core.files.storage import FileSystemStorage
+
+CHUNK_SIZE = 64 * 1024
+# файл блокировки в корне хранилища, общий для всех процессов
+LOCK_NAME = '.content-hash.lock'
+
+
+def content_hash(content) -> str:
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+class ContentHashStorage(FileSystemStorage):
+    """Хранилище, где имя файла - sha256 его содержимого.
+
+    Одинаковые загрузки попадают в один файл (и в один набор
+    миниатюр sorl). Каталог и расширение берутся из исходного имени.
+    Удалять файл можно, только когда на него не ссылается ни одна
+    запись - см. posts.images.release.
+
+    save отдает имя уже лежащего файла, ничего не записывая, а release
+    того же файла мог проверить ссылки раньше, чем новая запись
+    закоммичена, и удалить его. Поэтому release проверяет и удаляет
+    под lock(), а после коммита записи posts.images.keep под той же
+    блокировкой пишет пропавший файл заново.
+    """
+
+    @contextmanager
+    def lock(self):
+        """Исключительная блокировка хранилища между процессами."""
+        os.makedirs(self.location, exist_ok=True)
+        with open(os.path.join(self.location, LOCK_NAME), 'ab') as lock:
+            locks.lock(lock, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, content_hash(content) + extension)
+        if self.exists(name):
+            return name
+        # при одновременной загрузке одинаковых файлов проигравший
+        # получит имя с суффиксом - это лишняя копия, но не ошибка
+        return super().save(name, content, max_length)
@@ -0,0 +1,33 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts import caching
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def articles(context, posts) -> list:
+    """Посты ленты из кэша фрагментов, недостающие отрисовываются.
+
+    Все фрагменты страницы читаются одним get_many.
+    """
+    author = context.get('author')
+    posts = list(posts)
+    keys = [caching.fragment_key(post, bool(author)) for post in posts]
+    fragments = cache.get_many(keys)
+
+    missing = {}
+    for key, post in zip(keys, posts):
+        if key not in fragments:
+            missing[key] = render_to_string(
+                'includes/article.html', {'post': post, 'author': author}
+            )
+    if missing:
+        cache.set_many(missing, settings.FEED_CACHE_TIMEOUT)
+        fragments.update(missing)
+
+    return [mark_safe(fragments[key]) for key in keys]
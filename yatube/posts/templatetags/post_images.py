@@ -0,0 +1,17 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(image, geometry: str, **options) -> str:
+    """Адрес готовой миниатюры или оригинала, пока она режется."""
+    if not image:
+        return ''
+    thumbnail = thumbnails.lookup(image, geometry, **options)
+    if thumbnail is not None:
+        return thumbnail.url
+    thumbnails.schedule_on_commit(image.name)
+    return image.url
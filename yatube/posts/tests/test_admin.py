@@ -0,0 +1,132 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import paginators
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class TestAdmin(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Группа'
+        )
+
+    def setUp(self) -> None:
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count: int) -> None:
+        for _ in range(count):
+            user = User.objects.create_user(
+                username=f'user{User.objects.count()}'
+            )
+            post = Post.objects.create(
+                text='Пост', author=user, group=self.group
+            )
+            Comment.objects.create(post=post, author=user, text='Комментарий')
+            Follow.objects.create(user=user, author=self.admin)
+
+    def changelist_queries(self, model) -> int:
+        url = reverse(f'admin:posts_{model._meta.model_name}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries(self):
+        """Число запросов списка не растет вместе с числом строк."""
+        self.add_rows(2)
+        models = (Post, Comment, Follow, Group)
+        before = {model: self.changelist_queries(model) for model in models}
+        self.add_rows(5)
+        for model in models:
+            with self.subTest(model=model.__name__):
+                self.assertEqual(self.changelist_queries(model), before[model])
+
+    def test_comment_search(self):
+        """Комментарии ищутся по точному имени автора."""
+        self.add_rows(2)
+        url = reverse('admin:posts_comment_changelist')
+        response = self.client.get(url, {'q': 'user1'})
+        comments = list(response.context['cl'].result_list)
+        self.assertEqual(len(comments), 1)
+        self.assertEqual(comments[0].author.username, 'user1')
+
+    def test_estimated_count(self):
+        """Без фильтров число строк оценивается, а не считается."""
+        self.add_rows(3)
+        Post.objects.filter(pk=Post.objects.earliest('pk').pk).delete()
+        posts = Post.objects.all()
+        with mock.patch.object(paginators, 'ESTIMATE_FROM', 1):
+            # MAX(id) не меньше числа строк
+            self.assertEqual(
+                paginators.EstimatedCountPaginator(posts, 10).count,
+                Post.objects.latest('pk').pk
+            )
+            with mock.patch.object(paginators, 'COUNT_LIMIT', 1):
+                self.assertEqual(
+                    paginators.EstimatedCountPaginator(
+                        posts.filter(group=self.group), 10
+                    ).count,
+                    1
+                )
+
+    def test_estimated_tail_page(self):
+        """Пустая по оценке страница заменяется последней непустой."""
+        self.add_rows(3)
+        Post.objects.filter(pk__lt=Post.objects.latest('pk').pk).delete()
+        Post.objects.create(text='Пост', author=self.admin)
+        with mock.patch.object(paginators, 'ESTIMATE_FROM', 1):
+            paginator = paginators.EstimatedCountPaginator(
+                Post.objects.order_by('pk'), 1
+            )
+            self.assertEqual(paginator.num_pages, 4)
+            page = paginator.page(4)
+            self.assertEqual(page.number, 2)
+            self.assertEqual(len(page.object_list), 1)
+            self.assertEqual(paginator.count, 2)
+
+            url = reverse('admin:posts_post_changelist')
+            with mock.patch('posts.admin.PostAdmin.list_per_page', 1):
+                response = self.client.get(url, {'p': 3})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['cl'].result_list), 1)
+
+    def test_list_editable(self):
+        """Редактируемые колонки остаются, группы не грузятся списком."""
+        self.add_rows(2)
+        post = Post.objects.earliest('pk')
+        other = Group.objects.create(
+            title='Другая', slug='other', description='Другая'
+        )
+        url = reverse('admin:posts_post_changelist')
+        response = self.client.get(url)
+        self.assertIn('form-0-group', response.content.decode())
+        data = {
+            'form-TOTAL_FORMS': 2, 'form-INITIAL_FORMS': 2,
+            '_save': 'Сохранить',
+        }
+        for index, row in enumerate(Post.objects.order_by('-pub_date')):
+            data[f'form-{index}-id'] = row.pk
+            data[f'form-{index}-group'] = (
+                other.pk if row.pk == post.pk else self.group.pk
+            )
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        post.refresh_from_db()
+        self.assertEqual(post.group, other)
+
+        url = reverse('admin:posts_follow_changelist')
+        response = self.client.get(url, {'q': 'admin'})
+        self.assertIn('form-0-author', response.content.decode())
+        self.assertEqual(response.context['cl'].result_count, 2)
+        self.assertFalse(response.context['cl'].has_filters)
@@ -0,0 +1,214 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Min
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from posts import benchmark, search, thumbnails
+from posts.models import (
+    Comment, FanoutSettings, Follow, Group, Post, Profile, PullAuthor,
+    TimelineEntry, User
+)
+
+
+class TestCommands(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+
+    def test_rebuild_timelines(self):
+        """Пересборка восстанавливает ленту по подпискам."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.bulk_create(
+            [Post(text=f'Пост {i}', author=self.author) for i in range(3)]
+        )
+        # bulk_create не рассылает сигналы - лента отстала
+        self.assertEqual(self.reader.timeline.count(), 0)
+
+        call_command('rebuild_timelines', stdout=StringIO())
+
+        self.assertEqual(
+            set(self.reader.timeline.values_list('post_id', flat=True)),
+            set(Post.objects.values_list('id', flat=True))
+        )
+        self.assertEqual(TimelineEntry.objects.count(), 3)
+
+    def test_rebuild_timelines_prolific_author(self):
+        """Посты автора не упираются в лимит строк одного INSERT."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.author) for i in range(600)
+        )
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.reader.timeline.count(), 600)
+
+    @override_settings(FANOUT_THRESHOLD=2)
+    def test_set_fanout_threshold_sync(self):
+        """Подписка не переносит автора, это делает --sync."""
+        Post.objects.create(text='Пост', author=self.author)
+        fans = [
+            User.objects.create_user(username=f'fan{i}') for i in range(2)
+        ]
+        for fan in fans:
+            Follow.objects.create(user=fan, author=self.author)
+        self.assertFalse(PullAuthor.objects.exists())
+        self.assertEqual(TimelineEntry.objects.count(), 2)
+
+        out = StringIO()
+        call_command('set_fanout_threshold', sync=True, stdout=out)
+        self.assertIn('Проверено авторов: 1', out.getvalue())
+        self.assertTrue(PullAuthor.objects.filter(author=self.author))
+        self.assertFalse(TimelineEntry.objects.exists())
+        # отписка и новая подписка работают с лентой одного читателя
+        Follow.objects.filter(user=fans[0]).delete()
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+
+        Follow.objects.filter(author=self.author).delete()
+        call_command('set_fanout_threshold', sync=True, stdout=StringIO())
+        self.assertFalse(PullAuthor.objects.exists())
+
+    def test_recount(self):
+        """recount исправляет разошедшиеся счетчики."""
+        group = Group.objects.create(title='Г', slug='g', description='Г')
+        Post.objects.bulk_create(
+            [Post(text='Пост', author=self.author, group=group)] * 2
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        Profile.objects.filter(user=self.reader).delete()
+        Profile.objects.filter(user=self.author).update(followers_count=7)
+
+        call_command('recount', stdout=StringIO())
+
+        group.refresh_from_db()
+        self.assertEqual(group.posts_count, 2)
+        profile = Profile.objects.get(user=self.author)
+        self.assertEqual(profile.posts_count, 2)
+        self.assertEqual(profile.followers_count, 1)
+        self.assertEqual(
+            Profile.objects.get(user=self.reader).following_count, 1
+        )
+
+    def test_rebuild_search_index(self):
+        """Пересборка индекса находит посты, созданные в обход сигналов."""
+        Post.objects.bulk_create(
+            [Post(text='Поисковые запросы', author=self.author)]
+        )
+        self.assertEqual(search.search('запрос').count(), 0)
+
+        call_command('rebuild_search_index', stdout=StringIO())
+
+        self.assertEqual(search.search('запрос').count(), 1)
+
+    def image(self, color: int) -> bytes:
+        content = BytesIO()
+        Image.new('RGB', (2, 2), (color, 0, 0)).save(content, 'PNG')
+        return content.getvalue()
+
+    def test_warm_thumbnails(self):
+        """Прогрев режет только недостающие миниатюры."""
+        media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root, THUMBNAIL_ASYNC=False):
+            posts = [
+                Post.objects.create(
+                    text=f'Пост {i}',
+                    author=self.author,
+                    image=SimpleUploadedFile(f'{i}.png', self.image(i))
+                )
+                for i in range(3)
+            ]
+            thumbnails.render(posts[0].image)
+
+            out = StringIO()
+            call_command('warm_thumbnails', workers=0, stdout=out)
+            self.assertIn('готовы: 1, к нарезке: 2', out.getvalue())
+            self.assertIn('Нарезано: 2, ошибок: 0', out.getvalue())
+            for post in posts:
+                self.assertTrue(thumbnails.is_ready(post.image))
+
+            out = StringIO()
+            call_command('warm_thumbnails', workers=0, stdout=out)
+            self.assertIn('готовы: 3, к нарезке: 0', out.getvalue())
+
+    def test_benchmark(self):
+        """Прогон заполняет базу и пишет JSON по всем сценариям."""
+        output = os.path.join(tempfile.mkdtemp(), 'benchmark.json')
+        call_command(
+            'benchmark', users=30, groups=2, posts=200, comments=100,
+            follows=5, requests=2, warmup=1, in_place=True, output=output,
+            stderr=StringIO()
+        )
+        with open(output) as file:
+            report = json.load(file)
+        shutil.rmtree(os.path.dirname(output))
+
+        self.assertGreaterEqual(report['meta']['rows']['post'], 200)
+        self.assertEqual(
+            set(report['results']),
+            {scenario.name for scenario in benchmark.scenarios()}
+        )
+        for name, result in report['results'].items():
+            with self.subTest(scenario=name):
+                self.assertEqual(result['errors'], 0)
+                self.assertEqual(result['requests'], 2)
+                self.assertLessEqual(result['p50_ms'], result['max_ms'])
+
+        slower = {'index': dict(report['results']['index'])}
+        slower['index']['p95_ms'] *= 2
+        regressions = [
+            row for row in benchmark.compare(
+                slower, report['results'], threshold=0.2
+            ) if row[-1]
+        ]
+        self.assertEqual(
+            [row[:2] for row in regressions], [('index', 'p95_ms')]
+        )
+
+
+class TestSeed(TransactionTestCase):
+    """seed снимает индексы и строит их заново - нужна DDL вне транзакции."""
+
+    def test_seed(self):
+        # последний id удален: AUTOINCREMENT его больше не выдаст
+        author = User.objects.create_user(username='author')
+        Post.objects.create(text='Удаленный пост', author=author).delete()
+        call_command(
+            'seed', users=30, groups=2, posts=300, comments=200, follows=5,
+            days=30, stdout=StringIO()
+        )
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 200)
+        # порог остается в settings.FANOUT_THRESHOLD
+        self.assertFalse(FanoutSettings.objects.exists())
+        self.assertEqual(
+            sum(Profile.objects.values_list('posts_count', flat=True)), 300
+        )
+        self.assertTrue(TimelineEntry.objects.exists())
+
+        # даты растянуты в прошлое, комментарии не раньше постов
+        dates = Post.objects.aggregate(first=Min('pub_date'))
+        self.assertLess(dates['first'], timezone.now() - timedelta(days=29))
+        self.assertFalse(
+            Comment.objects.filter(created__lt=F('post__pub_date')).exists()
+        )
+        self.assertTrue(Post._meta.get_field('pub_date').auto_now_add)
+
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Post._meta.db_table
+            )
+        for index in Post._meta.indexes:
+            self.assertIn(index.name, constraints)
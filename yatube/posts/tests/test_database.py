@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase, override_settings
+
+
+class TestSqlitePragmas(SimpleTestCase):
+    @override_settings(SQLITE_PRAGMAS={
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'temp_store': 'memory',
+        'busy_timeout': 1234,
+    })
+    def test_new_connection(self):
+        """Новое соединение с файловой базой получает SQLITE_PRAGMAS."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        wrapper = DatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': os.path.join(directory, 'db.sqlite3'),
+        })
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+
+        expected = {
+            'journal_mode': 'wal',
+            'synchronous': 1,
+            'temp_store': 2,
+            'busy_timeout': 1234,
+        }
+        for name, value in expected.items():
+            with self.subTest(pragma=name):
+                self.assertEqual(
+                    wrapper.connection.execute(
+                        f'PRAGMA {name}'
+                    ).fetchone()[0],
+                    value
+                )
@@ -1,17 +1,23 @@
+import os
 import shutil
 import tempfile
+from io import BytesIO
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from posts import images
+from posts.forms import PostForm
 from posts.models import Comment, Post, Group, User
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=False)
 class TestForm(TestCase):
     @classmethod
     def setUpClass(cls) -> None:
@@ -71,7 +77,9 @@ class TestForm(TestCase):
         post: Post = Post.objects.all()[0]
         self.assertEqual(post.text, form_data['text'])
         self.assertEqual(post.group, Group.objects.get(pk=form_data['group']))
-        self.assertEqual(post.image.name, f'posts/{upload_image.name}')
+        # картинка пересохранена и названа по хэшу содержимого
+        self.assertRegex(post.image.name, r'^posts/[0-9a-f]{64}\.\w+$')
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
 
     def test_edit_post(self):
         """Проверка корректной работы измененеия поста."""
@@ -104,7 +112,110 @@ class TestForm(TestCase):
             'posts:post_detail',
             kwargs={'post_id': post.pk})
         )
-        self.assertEqual(post.image.name, f'posts/{upload_image.name}')
+        # картинка пересохранена и названа по хэшу содержимого
+        self.assertRegex(post.image.name, r'^posts/[0-9a-f]{64}\.\w+$')
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+
+    @override_settings(IMAGE_MAX_SIZE=100, IMAGE_FORMAT='JPEG')
+    def test_image_normalized(self):
+        """Большая картинка уменьшается и теряет метаданные."""
+        content = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        Image.new('RGB', (400, 200)).save(content, 'JPEG', exif=exif)
+        self.author_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Большая картинка',
+                'image': SimpleUploadedFile('big.jpeg', content.getvalue())
+            }
+        )
+        post = Post.objects.get(text='Большая картинка')
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        self.assertEqual((post.image_width, post.image_height), (100, 50))
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertNotIn('exif', image.info)
+
+    def test_form_with_plain_files(self):
+        """Форма работает с обычным словарем файлов и сама их закрывает."""
+        form = PostForm({'text': 'Пост'}, {'image': self.create_image()})
+        self.assertTrue(form.is_valid(), form.errors)
+        path = form.cleaned_data['image'].temporary_file_path()
+        form.save(commit=False)
+        form.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_broken_image(self):
+        """Обрезанная картинка - ошибка формы, а не 500."""
+        content = BytesIO()
+        # заголовок целый, и проверку ImageField файл проходит
+        Image.effect_noise((400, 200), 50).convert('RGB').save(
+            content, 'JPEG'
+        )
+        data = content.getvalue()
+        response = self.author_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Обрезанная картинка',
+                'image': SimpleUploadedFile(
+                    'broken.jpeg', data[:len(data) // 2]
+                )
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].has_error('image'))
+        self.assertFalse(
+            Post.objects.filter(text='Обрезанная картинка').exists()
+        )
+
+    def test_same_image_shared(self):
+        """Одинаковые картинки хранятся одним файлом до последнего поста."""
+        for text in ('Первый', 'Второй'):
+            self.author_client.post(
+                reverse('posts:post_create'),
+                data={'text': text, 'image': self.create_image()}
+            )
+        first = Post.objects.get(text='Первый')
+        second = Post.objects.get(text='Второй')
+        self.assertEqual(first.image.name, second.image.name)
+        storage, name = first.image.storage, first.image.name
+
+        with mock.patch.object(images.transaction, 'on_commit',
+                               side_effect=lambda func: func()):
+            first.delete()
+            self.assertTrue(storage.exists(name))
+            second.delete()
+            self.assertFalse(storage.exists(name))
+
+    def test_shared_image_released_before_commit(self):
+        """Файл, удаленный release до коммита нового поста, пишется заново."""
+        self.author_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Первый', 'image': self.create_image()}
+        )
+        storage = Post.objects.get(text='Первый').image.storage
+        save = storage.save
+        released = []
+
+        def save_then_release(name, content, max_length=None):
+            name = save(name, content, max_length)
+            if not released:
+                # параллельный release удалил уже лежавший файл
+                released.append(name)
+                storage.delete(name)
+            return name
+
+        with mock.patch.object(images.transaction, 'on_commit',
+                               side_effect=lambda func: func()), \
+                mock.patch.object(storage, 'save', save_then_release):
+            self.author_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Второй', 'image': self.create_image()}
+            )
+        second = Post.objects.get(text='Второй')
+        self.assertEqual(released, [second.image.name])
+        self.assertTrue(storage.exists(second.image.name))
 
     def test_create_form_comment(self):
         """Проверка создания комментария.
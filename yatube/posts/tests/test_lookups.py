@@ -0,0 +1,104 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+from django.test import Client, TransactionTestCase
+from django.urls import reverse
+
+from posts import lookups
+from posts.models import Follow, Group, Post, User
+
+
+class TestLookups(TransactionTestCase):
+    """Кэш групп и пользователей.
+
+    TransactionTestCase: внутри транзакции кэш не используется.
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        for lookup in (lookups.groups, lookups.users):
+            lookup.local.clear()
+            lookup.stats.update(local=0, shared=0, miss=0)
+        lookups.follow_stats.update(shared=0, miss=0)
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Группа'
+        )
+        self.author = User.objects.create_user(username='author')
+
+    def test_levels(self):
+        """Промах, затем LRU процесса, затем общий кэш."""
+        with self.assertNumQueries(1):
+            self.assertEqual(lookups.groups.get('group'), self.group)
+        with self.assertNumQueries(0):
+            lookups.groups.get('group')
+            lookups.groups.local.clear()
+            lookups.groups.get('group')
+        self.assertEqual(
+            lookups.stats()['group'], {'local': 1, 'shared': 1, 'miss': 1}
+        )
+        with self.assertRaises(Http404):
+            lookups.users.get_or_404('nobody')
+
+    def test_invalidation(self):
+        """Сохранение, переименование и счетчики сбрасывают записи."""
+        lookups.groups.get('group')
+        self.group.title = 'Новая группа'
+        self.group.save()
+        self.assertEqual(lookups.groups.get('group').title, 'Новая группа')
+
+        self.group.slug = 'renamed'
+        self.group.save()
+        self.assertIsNone(lookups.groups.get('group'))
+
+        self.assertEqual(lookups.users.get('author').profile.posts_count, 0)
+        Post.objects.create(text='Пост', author=self.author, group=self.group)
+        self.assertEqual(lookups.users.get('author').profile.posts_count, 1)
+        self.assertEqual(lookups.groups.get('renamed').posts_count, 1)
+
+        reader = User.objects.create_user(username='reader')
+        lookups.users.get('reader')
+        Follow.objects.create(user=reader, author=self.author)
+        self.assertEqual(
+            lookups.users.get('reader').profile.following_count, 1
+        )
+
+    def test_transaction(self):
+        """В транзакции объект всегда читается из базы."""
+        lookups.groups.get('group')
+        with transaction.atomic():
+            Group.objects.filter(pk=self.group.pk).update(title='В транзакции')
+            self.assertEqual(
+                lookups.groups.get('group').title, 'В транзакции'
+            )
+
+    def test_follows(self):
+        """Подписки читателя - одно множество в кэше."""
+        reader = User.objects.create_user(username='reader')
+        with self.assertNumQueries(1):
+            self.assertFalse(lookups.is_following(reader, self.author))
+            self.assertFalse(lookups.is_following(reader, self.author))
+        self.assertEqual(lookups.stats()['follows'], {'shared': 1, 'miss': 1})
+
+        Follow.objects.create(user=reader, author=self.author)
+        self.assertTrue(lookups.is_following(reader, self.author))
+        Follow.objects.filter(user=reader).delete()
+        self.assertEqual(lookups.followed_ids(reader.pk), frozenset())
+
+    def test_follow_views_ignore_stale_cache(self):
+        """Подписка и отписка пишут в базу, что бы ни лежало в кэше."""
+        reader = User.objects.create_user(username='reader')
+        client = Client()
+        client.force_login(reader)
+        key = lookups.FOLLOWS_KEY.format(reader.pk)
+        args = [self.author.username]
+
+        cache.set(key, frozenset({self.author.pk}))
+        client.get(reverse('posts:profile_follow', args=args))
+        self.assertTrue(
+            Follow.objects.filter(user=reader, author=self.author).exists()
+        )
+
+        cache.set(key, frozenset())
+        client.get(reverse('posts:profile_unfollow', args=args))
+        self.assertFalse(Follow.objects.filter(user=reader).exists())
+        self.assertFalse(lookups.is_following(reader, self.author))
@@ -0,0 +1,64 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core import metrics
+from posts.models import Post, User
+
+
+class TestMetrics(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self) -> None:
+        cache.clear()
+        metrics.registry.reset()
+        self.client = Client()
+
+    def test_histogram(self):
+        """Перцентили логарифмической гистограммы точны до 5%."""
+        histogram = metrics.Histogram()
+        for value in range(1, 1001):
+            histogram.record(value)
+        histogram.record(0)
+        for percent in metrics.PERCENTILES:
+            self.assertAlmostEqual(
+                histogram.percentile(percent), percent * 10,
+                delta=percent * 10 * 0.05
+            )
+        self.assertEqual(histogram.summary()['max'], 1000)
+        self.assertEqual(metrics.Histogram().percentile(50), 0)
+
+    def test_middleware(self):
+        """Запросы раскладываются по имени представления."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        views = metrics.registry.report()
+        index = views['posts:index']
+
+        self.assertEqual(index['wall_ms']['count'], 2)
+        self.assertEqual(set(index), set(metrics.METRICS))
+        # первый запрос собирает страницу, второй берет ее из кэша
+        self.assertGreater(index['sql_count']['max'], 0)
+        self.assertGreater(index['template_ms']['max'], 0)
+        self.assertGreater(index['cache_hits']['max'], 0)
+        self.assertGreater(index['cache_misses']['max'], 0)
+
+    def test_report_for_staff(self):
+        """Отчет доступен только staff."""
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('posts:index', response.json()['views'])
+        # счетчики кэша поиска групп, пользователей и подписок
+        lookups = response.json()['lookups']
+        self.assertEqual(set(lookups), {'group', 'user', 'follows'})
+        self.assertEqual(set(lookups['user']), {'local', 'shared', 'miss'})
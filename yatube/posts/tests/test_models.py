@@ -1,6 +1,6 @@
 from django.test import TestCase
 
-from posts.models import Group, Post, User
+from posts.models import Comment, Follow, Group, Post, Profile, User
 
 
 class TestModel(TestCase):
@@ -64,3 +64,73 @@ class TestModel(TestCase):
                     TestModel.post._meta.get_field(field).help_text,
                     expected_value
                 )
+
+
+class TestCounters(TestCase):
+    def setUp(self) -> None:
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа',
+            slug='group',
+            description='Описание'
+        )
+
+    def counters(self, user: User) -> tuple:
+        profile = Profile.objects.get(user=user)
+        return (
+            profile.posts_count,
+            profile.followers_count,
+            profile.following_count
+        )
+
+    def test_post_and_comment_counters(self):
+        post = Post.objects.create(
+            author=self.author, text='Пост', group=self.group
+        )
+        Comment.objects.create(post=post, author=self.reader, text='!')
+        Comment.objects.create(post=post, author=self.reader, text='?')
+
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.counters(self.author), (1, 0, 0))
+
+        # перенос в другую группу и снятие группы
+        group2 = Group.objects.create(title='2', slug='g2', description='2')
+        post.group = group2
+        post.save()
+        self.group.refresh_from_db()
+        group2.refresh_from_db()
+        self.assertEqual(
+            (self.group.posts_count, group2.posts_count), (0, 1)
+        )
+
+        # смена автора переносит пост между счетчиками профилей
+        post.author = self.reader
+        post.save()
+        self.assertEqual(self.counters(self.author), (0, 0, 0))
+        self.assertEqual(self.counters(self.reader), (1, 0, 0))
+        post.author = self.author
+        post.save()
+        self.assertEqual(self.counters(self.reader), (0, 0, 0))
+
+        # удаление читателя каскадом удаляет его комментарии
+        self.reader.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+        post.delete()
+        group2.refresh_from_db()
+        self.assertEqual(group2.posts_count, 0)
+        self.assertEqual(self.counters(self.author), (0, 0, 0))
+
+    def test_follow_counters(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.counters(self.author), (0, 1, 0))
+        self.assertEqual(self.counters(self.reader), (0, 0, 1))
+
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.counters(self.author), (0, 0, 0))
+        self.assertEqual(self.counters(self.reader), (0, 0, 0))
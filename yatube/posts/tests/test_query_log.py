@@ -0,0 +1,77 @@
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import querylog
+from posts.models import Post, User
+
+
+class TestQueryLog(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        Post.objects.create(text='Пост', author=cls.author)
+
+    def setUp(self) -> None:
+        cache.clear()
+        querylog.registry.reset()
+        self.client = Client()
+
+    def test_fingerprint(self):
+        """Литералы и длина списков параметров не меняют отпечаток."""
+        self.assertEqual(
+            querylog.fingerprint(
+                "SELECT  *\n FROM t WHERE a = 'x''y' AND b IN (%s, %s) "
+                'LIMIT 21'
+            ),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?'
+        )
+        self.assertEqual(
+            querylog.fingerprint('INSERT INTO t2 VALUES (%s, %s), (%s, %s)'),
+            querylog.fingerprint('INSERT INTO t2 VALUES (%s, %s)')
+        )
+
+    @override_settings(QUERY_LOG_SAMPLE_RATE=0)
+    def test_disabled(self):
+        self.client.get(reverse('posts:index'))
+        self.assertEqual(querylog.registry.report()['requests'], 0)
+
+    @override_settings(QUERY_LOG_SAMPLE_RATE=1, QUERY_LOG_SLOW_MS=0)
+    def test_report(self):
+        """Отпечатки копятся по представлению, у медленных есть план."""
+        for _ in range(2):
+            cache.clear()
+            self.client.get(reverse('posts:index'))
+        report = querylog.registry.report()
+        self.assertEqual(report['requests'], 2)
+
+        queries = report['queries']
+        self.assertTrue(queries)
+        self.assertEqual({query['view'] for query in queries}, {'posts:index'})
+        self.assertEqual(
+            [query['total_ms'] for query in queries],
+            sorted((query['total_ms'] for query in queries), reverse=True)
+        )
+        posts = [
+            query for query in queries
+            if query['sql'].startswith('SELECT')
+            and '"posts_post"' in query['sql']
+        ]
+        self.assertTrue(posts)
+        self.assertEqual(posts[0]['count'], 2)
+        self.assertTrue(posts[0]['plan'])
+
+    @override_settings(QUERY_LOG_SAMPLE_RATE=1)
+    def test_report_for_staff(self):
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('slow_queries'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('slow_queries'), {'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['queries']), 1)
+        response = self.client.get(reverse('slow_queries'), {'order': 'x'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,107 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, PullAuthor, User
+from posts.utils import encode_cursor
+
+# полный проход по таблице без индекса или сортировка во временном дереве;
+# проход по subquery - это счет не дальше LIMIT, его план проверяется
+# отдельными строками
+BAD_PLAN = re.compile(
+    r'^SCAN (?!subquery$)\w+$|^SCAN TABLE \w+$|TEMP B-TREE'
+)
+
+
+class TestQueryPlans(TestCase):
+    """Запросы лент идут по индексам.
+
+    Каждый SELECT, который делают страницы, прогоняется через
+    EXPLAIN QUERY PLAN.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.star = User.objects.create_user(username='star')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Группа'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.star)
+        PullAuthor.objects.create(author=cls.star)
+        for i in range(3):
+            for author in (cls.author, cls.star):
+                Post.objects.create(
+                    text=f'Пост {i}', author=author, group=cls.group
+                )
+        cls.post = Post.objects.filter(author=cls.author).first()
+        for i in range(3):
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f'Комментарий {i}'
+            )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def explain(self, sql: str, params) -> list:
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedQueries(self, url: str) -> None:
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        for sql, params in queries:
+            if not sql.startswith('SELECT') or '"posts_' not in sql:
+                continue
+            for step in self.explain(sql, params):
+                self.assertIsNone(
+                    BAD_PLAN.search(step), f'{step}\n{sql}'
+                )
+
+    def feed_urls(self) -> list:
+        cursor = encode_cursor((self.post.pub_date, self.post.pk))
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'group'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+        return urls + [f'{url}?after={cursor}' for url in urls] + [
+            f'{url}?before={cursor}' for url in urls
+        ]
+
+    def test_feed_query_plans(self):
+        for url in self.feed_urls():
+            with self.subTest(url=url):
+                self.assertIndexedQueries(url)
+
+    @override_settings(KEYSET_PAGINATION=True)
+    def test_keyset_query_plans(self):
+        for url in self.feed_urls():
+            with self.subTest(url=url):
+                self.assertIndexedQueries(url)
+
+    def test_bad_plan_detected(self):
+        """Сортировка без индекса не проходит проверку."""
+        sql, params = Post.objects.order_by('text').query.sql_with_params()
+        self.assertTrue(
+            any(BAD_PLAN.search(step) for step in self.explain(sql, params))
+        )
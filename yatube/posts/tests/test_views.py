@@ -1,21 +1,35 @@
 import shutil
 import tempfile
+import threading
+import time
+from unittest import mock
 
 from django.conf import settings
 from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.core.paginator import Page
+from django.core.paginator import EmptyPage, Page
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 
+from core.backends import event_timeout
+from core.decorators import QueryBudgetExceeded, query_budget
+from posts import caching, search, thumbnails, timeline, views
 from posts.forms import CommentForm, PostForm
-from posts.models import Comment, Follow, Group, Post, User
+from posts.models import (
+    Comment, Follow, Group, Post, Profile, PullAuthor, User
+)
+from posts.utils import FeedPaginator, encode_cursor
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+# миниатюры режутся сразу: фоновый поток писал бы в SQLite в памяти,
+# а она блокирует таблицы без ожидания
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=False)
 class TestView(TestCase):
     @classmethod
     def setUpClass(cls) -> None:
@@ -214,6 +228,40 @@ class TestView(TestCase):
         self.compare_comment(comment, comment_ret)
         self.assertIsInstance(response.context.get('form'), CommentForm)
 
+    def test_post_detail_queries(self):
+        """Число запросов страницы поста не зависит от комментариев."""
+        url = reverse(
+            'posts:post_detail',
+            kwargs={'post_id': self.post.pk}
+        )
+        per_page = settings.NUMBER_OF_COMMENTS_ON_PAGE
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.author_client.get(url)
+            return len(queries), response
+
+        # первый запрос создает миниатюру картинки
+        count_queries()
+        baseline, _ = count_queries()
+        for i in range(per_page * 2):
+            Comment.objects.create(
+                post=self.post,
+                author=User.objects.create_user(username=f'user{i}'),
+                text=f'Комментарий {i}'
+            )
+        queries, response = count_queries()
+        self.assertEqual(queries, baseline)
+
+        comments = response.context['comments']
+        self.assertEqual(len(comments), per_page)
+        self.assertTrue(comments.has_next())
+        response = self.author_client.get(
+            url, {'after': comments.next_cursor}
+        )
+        self.assertEqual(len(response.context['comments']), per_page)
+        self.assertFalse(response.context['comments'].has_next())
+
     def test_post_edit_page(self):
         """Проверка страницы редактирования(контекст, шаблон, данные)."""
         url = reverse(
@@ -344,6 +392,175 @@ class TestView(TestCase):
                         count_post_in_page
                     )
 
+    @override_settings(FEED_COUNT_LIMIT=15, FEED_PAGE_WINDOW=2)
+    def test_feed_paginator(self):
+        """Лента считается не дальше лимита, has_next - по лишней строке."""
+        cache.clear()
+        Post.objects.all().delete()
+        Post.objects.bulk_create(
+            Post(text=f'Пост № {i}', author=self.user_pshk)
+            for i in range(30)
+        )
+        posts = Post.objects.order_by('-id')
+
+        page = FeedPaginator(posts, 5).get_page(1)
+        self.assertIs(type(page), Page)
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.paginator.capped)
+        self.assertEqual(list(page.page_window), [1, 2, 3])
+
+        # дальше следующей за известной страницы не прыгнуть
+        page = FeedPaginator(posts, 5).get_page(5)
+        self.assertEqual(page.number, 3)
+        # следующая открывается и сдвигает счет в кэше
+        page = FeedPaginator(posts, 5).get_page(4)
+        self.assertTrue(page.has_next())
+
+        # счет взят из кэша, остается только выборка страницы
+        with self.assertNumQueries(1):
+            page = FeedPaginator(posts, 5).get_page(5)
+        self.assertEqual(len(page), 5)
+        self.assertTrue(page.has_next())
+        self.assertEqual(list(page.page_window), [3, 4, 5, 6])
+
+        page = FeedPaginator(posts, 5).get_page(6)
+        self.assertFalse(page.has_next())
+        self.assertFalse(page.paginator.capped)
+        self.assertEqual(page.paginator.count, 30)
+
+        page = FeedPaginator(posts, 5).get_page(9)
+        self.assertEqual(page.number, 6)
+        self.assertEqual(page[0].text, 'Пост № 4')
+
+        # страница далеко за концом: без пересчета и OFFSET за концом
+        with self.assertNumQueries(1):
+            page = FeedPaginator(posts, 5).get_page(999999999)
+        self.assertEqual(page.number, 6)
+
+        # лента стала короче счета: пересчет не дальше лимита, и
+        # последняя известная страница - по обрезанному счету
+        Post.objects.filter(text__in=['Пост № 0', 'Пост № 1']).delete()
+        with CaptureQueriesContext(connection) as captured:
+            page = FeedPaginator(posts, 5).get_page(7)
+        self.assertEqual(page.number, 3)
+        self.assertTrue(page.has_next())
+        self.assertTrue(any('LIMIT 15' in query['sql'] for query in captured))
+
+        # отставший счетчик не прячет страницы
+        page = FeedPaginator(posts, 5, count=3).get_page(2)
+        self.assertEqual(page.number, 2)
+        self.assertTrue(page.has_next())
+
+    def test_keyset_paginator(self):
+        """Проверим курсорную пагинацию: без COUNT и без пропусков."""
+        Post.objects.all().delete()
+        count_objects = settings.NUMBER_OF_LINES_ON_PAGE * 2 + 3
+        Post.objects.bulk_create(
+            [
+                Post(
+                    text='Пост № ' + str(i + 1),
+                    author=self.user_pshk,
+                    group=self.group1
+                ) for i in range(count_objects)
+            ]
+        )
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        url = reverse('posts:index')
+
+        with override_settings(KEYSET_PAGINATION=True):
+            seen = []
+            params = {}
+            while True:
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.author_client.get(url, params)
+                self.assertFalse(
+                    [q for q in queries if 'COUNT(' in q['sql']]
+                )
+                page = response.context['page_obj']
+                seen.extend(page.object_list)
+                if not page.has_next():
+                    break
+                self.assertEqual(page.next_page_number(), page.next_cursor)
+                params = {'after': page.next_cursor}
+            self.assertEqual(seen, expected)
+            # стандартный API Page на последней странице
+            with self.assertRaises(EmptyPage):
+                page.next_page_number()
+            self.assertEqual(
+                page.previous_page_number(), page.previous_cursor
+            )
+            self.assertEqual(page.start_index(), 1)
+            self.assertEqual(page.end_index(), 3)
+
+            # и обратно на шаг назад
+            response = self.author_client.get(
+                url, {'before': page.previous_cursor}
+            )
+            page = response.context['page_obj']
+            self.assertEqual(
+                list(page.object_list),
+                expected[
+                    -3 - settings.NUMBER_OF_LINES_ON_PAGE:-3
+                ]
+            )
+            self.assertTrue(page.has_next())
+            self.assertTrue(page.has_previous())
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_query_budgets(self):
+        """Страницы лент укладываются в объявленный бюджет запросов.
+
+        постов на странице больше, чем бюджет, поэтому N+1 не пройдет
+        """
+        reader, client = self.subscribe()
+        Post.objects.all().delete()
+        for i in range(settings.NUMBER_OF_LINES_ON_PAGE + 1):
+            Post.objects.create(
+                text=f'Пост {i}',
+                author=self.user_pshk,
+                group=self.group1
+            )
+        post = Post.objects.first()
+        for i in range(3):
+            Comment.objects.create(post=post, author=reader, text=str(i))
+
+        pages = (
+            (views.index, reverse('posts:index')),
+            (
+                views.group_posts,
+                reverse('posts:group_list', kwargs={'slug': 'group1'})
+            ),
+            (
+                views.profile,
+                reverse('posts:profile', kwargs={'username': 'pshk'})
+            ),
+            (views.follow_index, reverse('posts:follow_index')),
+            (
+                views.post_detail,
+                reverse('posts:post_detail', kwargs={'post_id': post.pk})
+            ),
+        )
+        for view, url in pages:
+            with self.subTest(url=url):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(queries), view.query_budget)
+
+    def test_query_budget_exceeded(self):
+        """Превышение бюджета видно сразу."""
+        @query_budget(0)
+        def view(request):
+            return User.objects.count()
+
+        with override_settings(QUERY_BUDGET_RAISE=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                view(None)
+        with self.assertLogs('core.decorators', 'WARNING'):
+            view(None)
+
     def test_for_not_posting_in_another_group(self):
         """Проверим что при наличии нескольких групп.
 
@@ -431,6 +648,15 @@ class TestView(TestCase):
         )
         self.assertEqual(TestView.user_pshk.following.filter(
             user=subscribe_user).exists(), False)
+        # посты автора ушли из ленты
+        self.assertFalse(subscribe_user.timeline.exists())
+
+    def test_subscribe_backfills_timeline(self):
+        """После подписки в ленте появляются уже написанные посты."""
+        user, client = self.subscribe()
+        response = client.get(reverse('posts:follow_index'))
+        page = response.context.get('page_obj')
+        self.assertIn(self.post, page.object_list)
 
     def test_the_post_appears_in_the_subscribers(self):
         """Новая запись пользователя появляется в ленте тех, кто.
@@ -462,6 +688,63 @@ class TestView(TestCase):
         self.assertIn(post, page.object_list)
         self.compare_posts(page.object_list[0], post)
 
+    @override_settings(FANOUT_THRESHOLD=2)
+    def test_hybrid_fan_out(self):
+        """Посты популярного автора подмешиваются в ленту при чтении.
+
+        порядок ленты такой же, как у прямого запроса по подпискам
+        """
+        user_leo = User.objects.create_user(username='leo')
+        reader, client = self.subscribe()
+        Follow.objects.create(user=reader, author=user_leo)
+        # второй подписчик доводит Пушкина до порога, на сторону pull
+        # его переносит sync_authors, а не запрос подписки
+        Follow.objects.create(
+            user=User.objects.create_user(username='fan'),
+            author=TestView.user_pshk
+        )
+        self.assertFalse(PullAuthor.objects.exists())
+        timeline.sync_authors()
+        for i in range(6):
+            Post.objects.create(
+                text=f'Пост {i}',
+                author=TestView.user_pshk if i % 2 else user_leo
+            )
+
+        self.assertTrue(
+            TestView.user_pshk.pull_side.pk
+        )
+        self.assertFalse(
+            reader.timeline.filter(post__author=TestView.user_pshk).exists()
+        )
+        expected = list(
+            Post.objects.filter(
+                author__following__user=reader
+            ).order_by('-pub_date', '-id')
+        )
+        response = client.get(reverse('posts:follow_index'))
+        page = response.context.get('page_obj')
+        self.assertEqual(list(page.object_list), expected)
+        cursor = encode_cursor((page[2].pub_date, page[2].pk))
+        response = client.get(
+            reverse('posts:follow_index'), {'after': cursor}
+        )
+        self.assertEqual(
+            list(response.context['page_obj'].object_list), expected[3:]
+        )
+
+        # у половины порога автор остается на стороне pull
+        Follow.objects.filter(user__username='fan').delete()
+        timeline.sync_authors()
+        self.assertTrue(PullAuthor.objects.exists())
+        # ниже половины порога возвращается к раскладке при записи
+        timeline.set_threshold(4)
+        self.assertFalse(PullAuthor.objects.exists())
+        self.assertEqual(
+            reader.timeline.count(),
+            Post.objects.filter(author__following__user=reader).count()
+        )
+
     def the_post_not_appears_in_the_subscribers(self):
         """Новая запись пользователя не появляется в ленте тех.
 
@@ -486,17 +769,324 @@ class TestView(TestCase):
         self.assertNotIn(post, page.object_list)
 
     def test_cache(self):
-        """Тестируем работу кэша."""
+        """Тестируем работу кэша.
+
+        страница живет в кэше, пока ее ленту не изменят
+        """
         post = Post.objects.create(
             text='Пост 2',
             author=TestView.user_pshk,
             group=TestView.group1
         )
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'group1'}),
+            reverse('posts:profile', kwargs={'username': 'pshk'}),
+        )
+
+        for url in urls:
+            with self.subTest(url=url):
+                response_before = self.author_client.get(url)
+                # update() не рассылает сигналы - кэш об этом не знает
+                Post.objects.filter(pk=post.pk).update(text='Тихая правка')
+                response_cached = self.author_client.get(url)
+                self.assertEqual(
+                    response_before.content, response_cached.content
+                )
+                Post.objects.filter(pk=post.pk).update(text='Пост 2')
 
-        response_before = self.author_client.get(reverse('posts:index'))
         post.delete()
-        response_after = self.author_client.get(reverse('posts:index'))
-        self.assertEqual(response_before.content, response_after.content)
-        cache.clear()
-        response_last = self.author_client.get(reverse('posts:index'))
-        self.assertNotEqual(response_after.content, response_last.content)
+        for url in urls:
+            with self.subTest(url=url):
+                response_after = self.author_client.get(url)
+                self.assertNotIn('Пост 2', response_after.content.decode())
+
+    def test_cache_stampede(self):
+        """Страницу пересчитывает только воркер с блокировкой."""
+        url = reverse('posts:index')
+        response_before = self.author_client.get(url)
+        Post.objects.create(text='Пост 2', author=TestView.user_pshk)
+        key = caching.page_key(response_before.wsgi_request, caching.INDEX)
+        lock = caching.LOCK_KEY.format(key)
+
+        # пока другой воркер пересчитывает, отдается прежняя версия
+        cache.add(lock, 1, caching.LOCK_TIMEOUT)
+        response_stale = self.author_client.get(url)
+        self.assertEqual(response_before.content, response_stale.content)
+
+        cache.delete(lock)
+        response_after = self.author_client.get(url)
+        self.assertIn('Пост 2', response_after.content.decode())
+
+    def test_profile_without_profile_row(self):
+        """Профиль пользователя из loaddata открывается без Profile."""
+        user = User(username='fixture')
+        user.save_base(raw=True)
+        Post.objects.create(text='Пост из фикстуры', author=user)
+        self.assertFalse(Profile.objects.filter(user=user).exists())
+        response = self.author_client.get(
+            reverse('posts:profile', kwargs={'username': 'fixture'})
+        )
+        self.assertContains(response, 'Пост из фикстуры')
+
+    def test_stale_etag(self):
+        """Прежняя версия ленты отдается со своим ETag, не с новым."""
+        url = reverse('posts:index')
+        response_before = self.author_client.get(url)
+        etag_before = response_before['ETag']
+        Post.objects.create(text='Пост 2', author=TestView.user_pshk)
+        key = caching.page_key(response_before.wsgi_request, caching.INDEX)
+        cache.add(caching.LOCK_KEY.format(key), 1, caching.LOCK_TIMEOUT)
+        response = self.author_client.get(url)
+        self.assertNotContains(response, 'Пост 2')
+        self.assertEqual(response['ETag'], etag_before)
+
+        response = self.author_client.get(url, HTTP_IF_NONE_MATCH=etag_before)
+        self.assertEqual(response.status_code, 200)
+
+        cache.delete(caching.LOCK_KEY.format(key))
+        response = self.author_client.get(url, HTTP_IF_NONE_MATCH=etag_before)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Пост 2')
+        self.assertNotEqual(response['ETag'], etag_before)
+
+    def test_get_or_compute(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(caching.get_or_compute('key', compute, 60), 1)
+        self.assertEqual(caching.get_or_compute('key', compute, 60), 1)
+        # новая версия
+        self.assertEqual(
+            caching.get_or_compute('key', compute, 60, version=2), 2
+        )
+        # срок вышел, значение еще лежит в кэше
+        cache.set('key', (2, 2, 0, 0), 60)
+        self.assertEqual(
+            caching.get_or_compute('key', compute, 60, version=2), 3
+        )
+        # ранний пересчет, когда до срока меньше времени пересчета
+        with mock.patch('random.random', return_value=0.99):
+            cache.set('key', (3, 2, time.time() + 1, 10), 60)
+            self.assertEqual(
+                caching.get_or_compute('key', compute, 60, version=2), 4
+            )
+        self.assertIsNone(cache.get(caching.LOCK_KEY.format('key')))
+
+        # не дождались чужого пересчета: считаем сами, но его
+        # блокировку не трогаем
+        lock = caching.LOCK_KEY.format('other')
+        cache.add(lock, 1, caching.LOCK_TIMEOUT)
+        with mock.patch.object(caching, 'LOCK_WAIT', 0):
+            self.assertEqual(caching.get_or_compute('other', compute, 60), 5)
+        self.assertEqual(cache.get(lock), 1)
+
+    def test_file_cache_single_flight(self):
+        """В файловом кэше пересчитывает только один воркер."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return len(calls)
+
+        has_key = FileBasedCache.has_key
+
+        def slow_has_key(*args, **kwargs):
+            # окно между has_key и set в add без блокировки
+            found = has_key(*args, **kwargs)
+            time.sleep(0.05)
+            return found
+
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'core.backends.FileBasedCache',
+            'LOCATION': directory,
+        }}), mock.patch.object(FileBasedCache, 'has_key', slow_has_key):
+            workers = [
+                threading.Thread(
+                    target=caching.get_or_compute, args=('key', compute, 60)
+                ) for _ in range(4)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        self.assertEqual(len(calls), 1)
+
+    def test_event_timeout(self):
+        """Кэш процесса не держит сбрасываемые событиями записи долго."""
+        self.assertEqual(event_timeout(None), settings.LOCAL_CACHE_TIMEOUT)
+        self.assertEqual(
+            event_timeout(settings.FEED_CACHE_TIMEOUT),
+            settings.LOCAL_CACHE_TIMEOUT
+        )
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'core.backends.FileBasedCache',
+            'LOCATION': directory,
+        }}):
+            self.assertIsNone(event_timeout(None))
+            self.assertEqual(
+                event_timeout(settings.FEED_CACHE_TIMEOUT),
+                settings.FEED_CACHE_TIMEOUT
+            )
+
+    def test_post_fragments(self):
+        """Посты в лентах собираются из кэша фрагментов."""
+        url = reverse('posts:group_list', kwargs={'slug': 'group1'})
+        self.author_client.get(url)
+        key = caching.fragment_key(Post.objects.get(pk=TestView.post.pk))
+        self.assertIn('Пост 1', cache.get(key))
+
+        # фрагмент берется из кэша, даже если пост поменяли в обход модели
+        cache.set(key, '<article>Из кэша</article>')
+        caching.bump(caching.group_scope('group1'))
+        response = self.author_client.get(url)
+        self.assertContains(response, 'Из кэша')
+
+        self.author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': TestView.post.pk}),
+            data={'text': 'Новый текст', 'group': TestView.group1.pk}
+        )
+        response = self.author_client.get(url)
+        self.assertContains(response, 'Новый текст')
+        self.assertNotContains(response, 'Из кэша')
+
+    def test_conditional_get(self):
+        """Неизменившиеся страницы отдают 304 без отрисовки."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'group1'}),
+            reverse('posts:profile', kwargs={'username': 'pshk'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.author_client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.author_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+                # другой пользователь видит другую шапку
+                self.assertNotEqual(Client().get(url)['ETag'], etag)
+
+        post = Post.objects.create(
+            text='Пост 2', author=TestView.user_pshk, group=TestView.group1
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.author_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        etag = self.author_client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        changes = (
+            lambda: Comment.objects.create(
+                post=post, author=TestView.user_pshk, text='Комментарий'
+            ),
+            lambda: self.author_client.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+                data={'text': 'Правка', 'group': TestView.group1.pk}
+            ),
+        )
+        for change in changes:
+            change()
+            response = self.author_client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+
+    def test_thumbnails(self):
+        """Миниатюры режутся вне запроса, до этого виден оригинал."""
+        post = TestView.post
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        geometry, options = settings.THUMBNAIL_GEOMETRIES[0]
+
+        for page in (url, reverse('posts:index')):
+            response = self.author_client.get(page)
+            self.assertContains(response, f'src="{post.image.url}"')
+
+        self.assertTrue(thumbnails.generate(post.image.name))
+        self.assertFalse(thumbnails.generate(post.image.name))
+        thumbnail = thumbnails.lookup(post.image, geometry, **options)
+        self.assertIsNotNone(thumbnail)
+        response = self.author_client.get(url)
+        self.assertContains(response, f'src="{thumbnail.url}"')
+        # страница ленты с оригиналом сброшена
+        response = self.author_client.get(reverse('posts:index'))
+        self.assertContains(response, f'src="{thumbnail.url}"')
+
+    def test_thumbnails_scheduled(self):
+        """Сохранение поста с картинкой ставит ее в очередь нарезки."""
+        with mock.patch.object(thumbnails, 'schedule') as schedule, \
+                mock.patch.object(thumbnails.transaction, 'on_commit',
+                                  side_effect=lambda func: func()):
+            self.author_client.post(
+                reverse('posts:post_edit',
+                        kwargs={'post_id': TestView.post.pk}),
+                data={'text': 'Правка'}
+            )
+        schedule.assert_called_once_with(TestView.post.image.name)
+
+    def test_search(self):
+        """Поиск по основам слов, текст поста важнее комментариев."""
+        cats = Post.objects.create(
+            text='Коты любят рыбу', author=TestView.user_pshk
+        )
+        dogs = Post.objects.create(
+            text='Про собак', author=TestView.user_pshk
+        )
+        Comment.objects.create(
+            post=dogs, author=TestView.user_pshk, text='А мой кот против'
+        )
+        url = reverse('posts:search')
+
+        response = self.author_client.get(url, {'q': 'котами'})
+        self.assertEqual(list(response.context['page_obj']), [cats, dogs])
+        response = self.author_client.get(url, {'q': 'Собаки'})
+        self.assertEqual(list(response.context['page_obj']), [dogs])
+        # последнее слово ищется как префикс
+        response = self.author_client.get(url, {'q': 'рыб'})
+        self.assertEqual(list(response.context['page_obj']), [cats])
+
+        # комментарий индексируется своей строкой, без соседей
+        for i in range(3):
+            Comment.objects.create(
+                post=dogs, author=TestView.user_pshk, text=f'Гав {i}'
+            )
+        with CaptureQueriesContext(connection) as captured:
+            comment = Comment.objects.create(
+                post=dogs, author=TestView.user_pshk, text='Мяу'
+            )
+        self.assertFalse([
+            query for query in captured
+            if '"posts_comment"' in query['sql']
+            and query['sql'].startswith('SELECT')
+        ])
+        response = self.author_client.get(url, {'q': 'мяу'})
+        self.assertEqual(list(response.context['page_obj']), [dogs])
+        comment.delete()
+        response = self.author_client.get(url, {'q': 'мяу'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+        cats.text = 'Кошки'
+        cats.save()
+        dogs.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {search.COMMENTS_TABLE}')
+            self.assertEqual(cursor.fetchone()[0], 0)
+        response = self.author_client.get(url, {'q': 'кот'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+        response = self.author_client.get(url, {'q': 'кошка'})
+        self.assertEqual(list(response.context['page_obj']), [cats])
@@ -0,0 +1,125 @@
+"""Нарезка миниатюр картинок постов вне запроса.
+
+После коммита сохранения поста с картинкой все размеры из
+THUMBNAIL_GEOMETRIES режутся в пуле потоков. Шаблоны берут только
+уже готовые миниатюры (lookup) и до их появления показывают оригинал.
+Когда миниатюры готовы, посты с этой картинкой считаются изменившимися:
+обновляется Post.updated и поколения их лент.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import caching
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+# картинки, которые уже стоят в очереди
+_pending = set()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def lookup(file_, geometry: str, **options):
+    """Готовая миниатюра из хранилища ключей sorl или None.
+
+    Повторяет подготовку опций ThumbnailBackend.get_thumbnail,
+    чтобы получить то же имя файла, но ничего не режет.
+    """
+    backend = default.backend
+    source = ImageFile(file_)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return default.kvstore.get(ImageFile(name, default.storage))
+
+
+def is_ready(file_) -> bool:
+    return all(
+        lookup(file_, geometry, **options)
+        for geometry, options in settings.THUMBNAIL_GEOMETRIES
+    )
+
+
+def render(file_) -> bool:
+    """Нарезать недостающие размеры картинки.
+
+    Возвращает False, если все миниатюры уже были готовы.
+    """
+    if is_ready(file_):
+        return False
+    for geometry, options in settings.THUMBNAIL_GEOMETRIES:
+        get_thumbnail(file_, geometry, **options)
+    return True
+
+
+def touch(name: str) -> None:
+    """Сбросить кэши страниц, где вместо миниатюры стоял оригинал."""
+    posts = Post.objects.filter(image=name).select_related('author', 'group')
+    posts.update(updated=timezone.now())
+    for post in posts:
+        caching.bump(*caching.post_scopes(post))
+
+
+def generate(name: str) -> bool:
+    """Нарезать все размеры картинки и обновить посты с ней."""
+    post = Post.objects.filter(image=name).first()
+    if post is None or not render(post.image):
+        return False
+    touch(name)
+    return True
+
+
+def _run(name: str) -> None:
+    try:
+        generate(name)
+    except Exception:
+        logger.exception('Не удалось нарезать миниатюры %s', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        # у каждого потока пула свое соединение с базой
+        connection.close()
+
+
+def schedule(name: str) -> None:
+    """Поставить картинку в очередь нарезки."""
+    if not settings.THUMBNAIL_ASYNC:
+        generate(name)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    get_executor().submit(_run, name)
+
+
+def schedule_on_commit(name: str) -> None:
+    """Нарезать после коммита: воркер должен увидеть пост в базе."""
+    transaction.on_commit(lambda: schedule(name))
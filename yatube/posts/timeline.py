@@ -0,0 +1,211 @@
+"""Материализованная лента подписок.
+
+Посты обычных авторов раскладываются в TimelineEntry всех подписчиков
+при публикации (fan-out on write), поэтому follow_index читает ленту
+одним диапазоном индекса (user, pub_date) без соединения с Follow.
+
+Авторы, у которых подписчиков не меньше порога, хранятся как
+PullAuthor: их посты в ленты не пишутся, а подмешиваются при чтении
+отдельным источником. Посты автора всегда лежат ровно в одном месте,
+поэтому источники не пересекаются.
+
+Подписка и отписка сторону автора не меняют: перенос стоит записи
+всех его постов во все ленты, поэтому авторов пересортировывает
+sync_authors вне запроса (set_fanout_threshold --sync по расписанию).
+Обратно на push автор переходит, только когда подписчиков стало
+меньше половины порога, чтобы он не метался у границы.
+"""
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import connection
+
+from . import counters, lookups
+from .models import (
+    FanoutSettings, Follow, Post, Profile, PullAuthor, TimelineEntry, User
+)
+from .utils import FeedSource, MergedFeed
+
+BATCH_SIZE = 1000
+INSERT_FIELDS = ('user', 'post', 'pub_date')
+
+
+def _batch_size() -> int:
+    # явный batch_size Django 2.2 не сверяет с лимитами базы, а SQLite
+    # принимает ограниченное число параметров в одном INSERT
+    return connection.ops.bulk_batch_size(INSERT_FIELDS, range(BATCH_SIZE))
+
+
+def get_threshold() -> int:
+    threshold = FanoutSettings.objects.filter(pk=1).values_list(
+        'threshold', flat=True
+    ).first()
+    return settings.FANOUT_THRESHOLD if threshold is None else threshold
+
+
+def is_pull_author(author_id: int) -> bool:
+    return PullAuthor.objects.filter(author_id=author_id).exists()
+
+
+def sync_author(author_id: int, threshold: int = None) -> bool:
+    """Перевести автора на сторону pull или push по числу подписчиков.
+
+    Возвращает True, если посты автора подмешиваются при чтении.
+    """
+    if threshold is None:
+        threshold = get_threshold()
+    followers = counters.followers_count(author_id)
+    was_pull = is_pull_author(author_id)
+    if was_pull:
+        pull = followers >= threshold // 2
+    else:
+        pull = followers >= threshold
+
+    if pull and not was_pull:
+        PullAuthor.objects.create(author_id=author_id)
+        TimelineEntry.objects.filter(post__author_id=author_id).delete()
+    elif was_pull and not pull:
+        follower_ids = Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)
+        for user_id in follower_ids.iterator():
+            backfill(user_id, author_id)
+        PullAuthor.objects.filter(author_id=author_id).delete()
+    return pull
+
+
+def sync_authors(threshold: int = None) -> int:
+    """Пересортировать авторов у порога и тех, кто сейчас на стороне pull.
+
+    Возвращает количество проверенных авторов.
+    """
+    if threshold is None:
+        threshold = get_threshold()
+    candidates = set(
+        Profile.objects.filter(
+            followers_count__gte=threshold
+        ).values_list('pk', flat=True)
+    )
+    candidates.update(PullAuthor.objects.values_list('author_id', flat=True))
+    for author_id in candidates:
+        sync_author(author_id, threshold)
+    return len(candidates)
+
+
+def set_threshold(threshold: int) -> int:
+    """Сменить порог и пересортировать затронутых авторов.
+
+    Возвращает количество проверенных авторов.
+    """
+    FanoutSettings.objects.update_or_create(
+        pk=1, defaults={'threshold': threshold}
+    )
+    return sync_authors(threshold)
+
+
+def fan_out(post: Post) -> None:
+    """Разложить новый пост по лентам подписчиков автора."""
+    if is_pull_author(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in follower_ids.iterator()
+        ),
+        batch_size=_batch_size(),
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_id: int, author_id: int) -> None:
+    """Добавить в ленту читателя все посты нового автора."""
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, post_id=post_id, pub_date=date)
+            for post_id, date in posts.iterator()
+        ),
+        batch_size=_batch_size(),
+        ignore_conflicts=True
+    )
+
+
+def follow(user_id: int, author_id: int) -> None:
+    """Подписка: посты push-автора догружаются в ленту читателя."""
+    if not is_pull_author(author_id):
+        backfill(user_id, author_id)
+
+
+def unfollow(user_id: int, author_id: int) -> None:
+    """Отписка: посты автора убираются из ленты читателя."""
+    prune(user_id, author_id)
+
+
+def prune(user_id: int, author_id: int) -> None:
+    """Убрать из ленты читателя посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def rebuild(user: User = None) -> int:
+    """Пересобрать ленты с нуля по таблице Follow.
+
+    Ленты заполняются одним INSERT ... SELECT в базе, без выборки
+    постов в Python. Возвращает количество обработанных подписок.
+    """
+    entries = TimelineEntry.objects.all()
+    follows = Follow.objects.filter(author__pull_side__isnull=True)
+    if user is not None:
+        entries = entries.filter(user=user)
+        follows = follows.filter(user=user)
+    entries.delete()
+
+    sql = (
+        f'INSERT INTO {TimelineEntry._meta.db_table} '
+        '(user_id, post_id, pub_date) '
+        'SELECT follow.user_id, post.id, post.pub_date '
+        f'FROM {Follow._meta.db_table} follow '
+        f'JOIN {Post._meta.db_table} post '
+        'ON post.author_id = follow.author_id '
+        f'WHERE NOT EXISTS (SELECT 1 FROM {PullAuthor._meta.db_table} pull '
+        'WHERE pull.author_id = follow.author_id)'
+    )
+    params = []
+    if user is not None:
+        sql += ' AND follow.user_id = %s'
+        params.append(user.pk)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+    return follows.count()
+
+
+def feed(user: User) -> MergedFeed:
+    """Лента подписок: разложенные посты плюс популярные авторы."""
+    sources = [
+        FeedSource(
+            TimelineEntry.objects.filter(user=user).select_related(
+                'post__author', 'post__group'
+            ),
+            keys=('pub_date', 'post_id'),
+            item=attrgetter('post')
+        )
+    ]
+    followed = lookups.followed_ids(user.pk)
+    pull_ids = PullAuthor.objects.filter(
+        author_id__in=followed
+    ).values_list('author_id', flat=True) if followed else ()
+    for author_id in pull_ids:
+        sources.append(
+            FeedSource(
+                Post.objects.select_related('author', 'group').filter(
+                    author_id=author_id
+                )
+            )
+        )
+    return MergedFeed(sources)
@@ -18,6 +18,7 @@ urlpatterns = [
         name='profile_unfollow'
     ),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search_posts, name='search'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path(
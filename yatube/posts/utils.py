@@ -1,9 +1,373 @@
+import hashlib
+import heapq
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from operator import itemgetter
+
 from django.conf import settings
-from django.core.paginator import Page, Paginator
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db.models import Q, QuerySet
 from django.http import HttpRequest
+from django.utils.functional import cached_property
+
+COUNT_KEY = 'feed:count:{}'
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(values: tuple) -> str:
+    """Кодирует значения ключа (дата, id) в токен для url."""
+    parts = []
+    for value in values:
+        if isinstance(value, datetime):
+            value = (value - EPOCH) // timedelta(microseconds=1)
+        parts.append(str(value))
+    return '_'.join(parts)
+
+
+def decode_cursor(token: str) -> tuple:
+    """Обратное преобразование токена, None для испорченного токена."""
+    try:
+        micros, pk = token.split('_')
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+class KeysetPage(Page):
+    """Страница курсорной пагинации.
+
+    Совместима с Page по интерфейсу шаблонов, но номера страниц
+    не знает: переходы только вперед/назад по токенам after/before.
+    next_page_number/previous_page_number отдают те же токены,
+    start_index/end_index считаются в пределах страницы.
+    """
+
+    def __init__(self, object_list, paginator, cursor='',
+                 has_next=False, has_previous=False):
+        super().__init__(object_list, 1, paginator)
+        self.cursor = cursor
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    @property
+    def next_cursor(self) -> str:
+        return self.paginator.cursor_for(self.object_list[-1])
+
+    @property
+    def previous_cursor(self) -> str:
+        return self.paginator.cursor_for(self.object_list[0])
+
+    def next_page_number(self) -> str:
+        if not self.has_next():
+            raise EmptyPage('That page contains no results')
+        return self.next_cursor
+
+    def previous_page_number(self) -> str:
+        if not self.has_previous():
+            raise EmptyPage('That page number is less than 1')
+        return self.previous_cursor
+
+    def start_index(self) -> int:
+        return 1 if self.object_list else 0
+
+    def end_index(self) -> int:
+        return len(self.object_list)
+
+
+class FeedSource:
+    """Один упорядоченный источник ленты.
+
+    keys - поля сортировки (дата, id), одновременно имена для
+    фильтра и атрибуты строк; item превращает строку в пост.
+    """
+
+    def __init__(self, queryset: QuerySet, keys=('pub_date', 'id'),
+                 item=None):
+        self.queryset = queryset
+        self.keys = keys
+        self.item = item
+
+    def key(self, row) -> tuple:
+        return tuple(getattr(row, key) for key in self.keys)
+
+    def rows(self, cursor: tuple = None, newer: bool = False) -> QuerySet:
+        """Строки от курсора: старее него или, при newer, новее."""
+        date_key, id_key = self.keys
+        queryset = self.queryset
+        if cursor is not None:
+            date, pk = cursor
+            lookup = 'gt' if newer else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'{date_key}__{lookup}': date})
+                | Q(**{date_key: date, f'{id_key}__{lookup}': pk})
+            )
+        if newer:
+            return queryset.order_by(date_key, id_key)
+        return queryset.order_by(f'-{date_key}', f'-{id_key}')
+
+    def to_item(self, row):
+        return self.item(row) if self.item else row
+
+    def stream(self, cursor=None, newer=False, limit=None):
+        """Пары (ключ, пост) в порядке ленты для слияния."""
+        rows = self.rows(cursor, newer)
+        if limit is not None:
+            rows = rows[:limit]
+        for row in rows:
+            yield self.key(row), self.to_item(row)
+
+
+class MergedFeed:
+    """Лента из нескольких непересекающихся источников.
+
+    Каждый источник читается своим индексом, страница собирается
+    слиянием уже отсортированных выборок, без общего ORDER BY.
+    Поддерживает count() и срезы, поэтому годится для Paginator.
+    """
+
+    def __init__(self, sources):
+        self.sources = list(sources)
+
+    def count(self, limit: int = None) -> int:
+        querysets = (source.queryset for source in self.sources)
+        if limit is not None:
+            querysets = (
+                queryset.order_by()[:limit] for queryset in querysets
+            )
+        return sum(queryset.count() for queryset in querysets)
 
+    def __len__(self) -> int:
+        return self.count()
 
-def get_page_obj(request: HttpRequest, list_object: list) -> Page:
-    paginator = Paginator(list_object, settings.NUMBER_OF_LINES_ON_PAGE)
+    def merge(self, cursor=None, newer=False, limit=None) -> list:
+        streams = [
+            source.stream(cursor, newer, limit) for source in self.sources
+        ]
+        merged = heapq.merge(
+            *streams, key=itemgetter(0), reverse=not newer
+        )
+        return [item for _, item in islice(merged, limit)]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop = index.start or 0, index.stop
+            return self.merge(limit=stop)[start:]
+        return self.merge(limit=index + 1)[index]
+
+
+class KeysetPaginator:
+    """Пагинация по ключу (pub_date, id) без COUNT и OFFSET.
+
+    Каждая страница - это одна выборка по индексу вида
+    WHERE (pub_date, id) < (:pub_date, :id) LIMIT per_page + 1,
+    лишняя строка показывает, есть ли следующая страница.
+    """
+
+    keyset = True
+
+    def __init__(self, object_list, per_page: int,
+                 keys=('pub_date', 'id')):
+        if not isinstance(object_list, MergedFeed):
+            object_list = MergedFeed([FeedSource(object_list, keys)])
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.keys = keys
+
+    def cursor_for(self, obj) -> str:
+        return encode_cursor(tuple(getattr(obj, key) for key in self.keys))
+
+    def get_page(self, after: str = None, before: str = None) -> KeysetPage:
+        limit = self.per_page + 1
+
+        if before and decode_cursor(before):
+            rows = self.object_list.merge(
+                decode_cursor(before), newer=True, limit=limit
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            if not rows:
+                return self.get_page()
+            return KeysetPage(rows, self, f'before:{before}',
+                              has_next=True, has_previous=has_previous)
+
+        cursor = ''
+        if after and decode_cursor(after):
+            cursor = f'after:{after}'
+        rows = self.object_list.merge(
+            decode_cursor(after) if cursor else None, limit=limit
+        )
+        if cursor and not rows:
+            # курсор за концом ленты, пустой странице некуда ссылаться
+            return self.get_page()
+        return KeysetPage(rows[:self.per_page], self, cursor,
+                          has_next=len(rows) > self.per_page,
+                          has_previous=bool(cursor))
+
+
+def _count_key(object_list):
+    """Ключ кэша для числа строк выборки, None - не кэшировать."""
+    if isinstance(object_list, MergedFeed):
+        querysets = [source.queryset for source in object_list.sources]
+    elif isinstance(object_list, QuerySet):
+        querysets = [object_list]
+    else:
+        return None
+    try:
+        sql = '|'.join(str(queryset.query) for queryset in querysets)
+    except EmptyResultSet:
+        return None
+    return COUNT_KEY.format(hashlib.md5(sql.encode()).hexdigest())
+
+
+class FeedPaginator(Paginator):
+    """Paginator для лент без точного COUNT на каждый запрос.
+
+    Число постов берется из поддерживаемого счетчика (count=...)
+    или считается не дальше FEED_COUNT_LIMIT строк и держится в кэше
+    FEED_COUNT_TIMEOUT секунд. Страница читается с одной лишней
+    строкой: по ней has_next отвечает точно, даже если счетчик
+    отстал или обрезан, а count поправляется под увиденное (и в кэше).
+    Номер дальше следующей за последней известной страницы сразу
+    ведет на последнюю: по длинной ленте идут страница за страницей,
+    без OFFSET вслепую. Ссылки на страницы - только окно вокруг
+    текущей (page_window).
+    """
+
+    def __init__(self, object_list, per_page, count: int = None,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        # счетчик ленты точный, обрезанный COUNT - нет
+        self.exact = count is not None
+        self._key = None
+        if count is not None:
+            self.count = count
+        else:
+            self._key = _count_key(object_list)
+
+    @cached_property
+    def count(self) -> int:
+        count = cache.get(self._key) if self._key else None
+        if count is None:
+            count = self._count_rows()
+        return count
+
+    def _count_rows(self) -> int:
+        """Число строк не дальше FEED_COUNT_LIMIT, кладется в кэш."""
+        limit = settings.FEED_COUNT_LIMIT
+        if isinstance(self.object_list, MergedFeed):
+            count = self.object_list.count(limit=limit)
+        elif isinstance(self.object_list, QuerySet):
+            count = self.object_list.order_by()[:limit].count()
+        else:
+            return len(self.object_list)
+        if self._key:
+            cache.set(self._key, count, settings.FEED_COUNT_TIMEOUT)
+        return count
+
+    @property
+    def capped(self) -> bool:
+        """Счет уперся в лимит, номер последней страницы неизвестен."""
+        return not self.exact and self.count >= settings.FEED_COUNT_LIMIT
+
+    def _set_count(self, count: int, exact: bool) -> None:
+        self.exact = self.exact or exact
+        if count != self.count:
+            self.count = count
+            self.__dict__.pop('num_pages', None)
+            if self._key:
+                cache.set(self._key, count, settings.FEED_COUNT_TIMEOUT)
+
+    def _correct(self, bottom: int, shown: int, has_next: bool) -> None:
+        """Подогнать count под строки, прочитанные на странице."""
+        if has_next:
+            self._set_count(max(self.count, bottom + shown + 1), exact=False)
+        elif shown or not bottom:
+            self._set_count(bottom + shown, exact=True)
+        else:
+            # счет отстал от ленты, которая стала короче: пересчитать
+            # с тем же лимитом, без полного COUNT
+            count = self._count_rows()
+            self._set_count(count, exact=count < settings.FEED_COUNT_LIMIT)
+
+    def validate_number(self, number) -> int:
+        # счет может отставать от ленты не больше чем на страницу:
+        # следующую за последней проверяет сама страница, дальние -
+        # сразу EmptyPage, чтобы не читать OFFSET за концом ленты
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            number = int(number)
+            if number < 1 or number > self.num_pages + 1:
+                raise
+            return number
+
+    def page(self, number) -> Page:
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        self._correct(bottom, len(rows), has_next)
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        page = self._get_page(rows, number, self)
+        page.page_window = self.page_window(number)
+        return page
+
+    def get_page(self, number) -> Page:
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            # счет отставал от ленты: после поправки num_pages
+            # указывает на последнюю страницу
+            return self.page(self.num_pages)
+
+    def page_window(self, number: int) -> range:
+        size = settings.FEED_PAGE_WINDOW
+        return range(
+            max(1, number - size), min(self.num_pages, number + size) + 1
+        )
+
+
+def get_page_obj(request: HttpRequest, list_object: list,
+                 count: int = None) -> Page:
+    """Возвращает страницу ленты.
+
+    Курсорный режим включается настройкой KEYSET_PAGINATION
+    или наличием в запросе токена after/before. count - известное
+    заранее число постов ленты (счетчик группы или автора).
+    """
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if settings.KEYSET_PAGINATION or after or before:
+        paginator = KeysetPaginator(
+            list_object, settings.NUMBER_OF_LINES_ON_PAGE
+        )
+        return paginator.get_page(after=after, before=before)
+
+    paginator = FeedPaginator(
+        list_object, settings.NUMBER_OF_LINES_ON_PAGE, count=count
+    )
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
+
+
+def get_comments_page(request: HttpRequest, comments: QuerySet) -> Page:
+    """Страница комментариев, всегда курсорная по (created, id)."""
+    paginator = KeysetPaginator(
+        comments,
+        settings.NUMBER_OF_COMMENTS_ON_PAGE,
+        keys=('created', 'id')
+    )
+    return paginator.get_page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
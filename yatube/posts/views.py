@@ -1,51 +1,71 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
+
+from core.decorators import query_budget
 
+from . import caching, lookups, queries, search
+from .caching import cache_feed, feed_etag, post_etag
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
-from .utils import get_page_obj
+from .models import Comment, Follow, Post
+from .utils import FeedPaginator, get_comments_page, get_page_obj
 
 
-@cache_page(20)
+@condition(etag_func=feed_etag(lambda: caching.INDEX))
+@cache_feed(lambda: caching.INDEX)
+@query_budget(5)
 def index(request: HttpRequest) -> HttpResponse:
-    post_list = Post.objects.select_related('author', 'group').all()
+    post_list = queries.index_feed()
     context = {
         'page_obj': get_page_obj(request, post_list),
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=feed_etag(caching.group_scope))
+@cache_feed(caching.group_scope)
+@query_budget(6)
 def group_posts(request: HttpRequest, slug: str) -> HttpResponse:
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    group = lookups.groups.get_or_404(slug)
+    post_list = queries.group_feed(group)
     context = {
         'group': group,
-        'page_obj': get_page_obj(request, post_list),
+        'page_obj': get_page_obj(request, post_list, group.posts_count),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=feed_etag(caching.profile_scope))
+@cache_feed(caching.profile_scope)
+@query_budget(7)
 def profile(request: HttpRequest, username: str) -> HttpResponse:
-    user = get_object_or_404(User, username=username)
-    post_list = Post.objects.filter(
-        author=user).prefetch_related('author', 'group').all()
-    following = (request.user.is_authenticated
-                 and user.following.filter(user=request.user).exists())
+    user = lookups.users.get_or_404(username)
+    post_list = queries.profile_feed(user)
+    following = lookups.is_following(request.user, user)
+    # у пользователей из loaddata профиля может не быть (его соберет
+    # recount), тогда посты посчитает пагинатор
+    profile = getattr(user, 'profile', None)
     context = {
         'author': user,
-        'page_obj': get_page_obj(request, post_list),
+        'page_obj': get_page_obj(
+            request, post_list, profile and profile.posts_count
+        ),
         'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+@condition(etag_func=post_etag)
+@query_budget(5)
 def post_detail(request: HttpRequest, post_id: int) -> HttpResponse:
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(queries.post_detail(), pk=post_id)
     form = CommentForm()
 
-    comments = post.comments.all()
+    comments = get_comments_page(request, queries.post_comments(post))
     context = {
         'post': post,
         'form': form,
@@ -60,11 +80,14 @@ def post_create(request: HttpRequest) -> HttpResponse:
         request.POST or None,
         files=request.FILES or None
     )
-    if form.is_valid():
-        post = form.save(commit=False)
-        post.author = request.user
-        post.save()
-        return redirect('posts:profile', username=request.user)
+    try:
+        if form.is_valid():
+            post = form.save(commit=False)
+            post.author = request.user
+            post.save()
+            return redirect('posts:profile', username=request.user)
+    finally:
+        form.close()
 
     context = {
         'form': form,
@@ -84,9 +107,12 @@ def post_edit(request: HttpRequest, post_id: int) -> HttpResponse:
         files=request.FILES or None,
         instance=post
     )
-    if form.is_valid():
-        form.save()
-        return redirect('posts:post_detail', post_id=post_id)
+    try:
+        if form.is_valid():
+            form.save()
+            return redirect('posts:post_detail', post_id=post_id)
+    finally:
+        form.close()
 
     context = {
         'is_edit': True,
@@ -110,27 +136,44 @@ def add_comment(request: HttpRequest, post_id: int):
 
 
 @login_required
+@query_budget(6)
 def follow_index(request: HttpRequest):
-    post_list = Post.objects.select_related(
-        'author', 'group').filter(author__following__user=request.user)
+    post_list = queries.follow_feed(request.user)
     context = {
         'page_obj': get_page_obj(request, post_list),
     }
     return render(request, 'posts/follow.html', context)
 
 
+@query_budget(5)
+def search_posts(request: HttpRequest) -> HttpResponse:
+    query = request.GET.get('q', '').strip()
+    paginator = FeedPaginator(
+        search.search(query), settings.NUMBER_OF_LINES_ON_PAGE
+    )
+    context = {
+        'query': query,
+        'query_string': urlencode({'q': query}),
+        'page_obj': paginator.get_page(request.GET.get('page')),
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def profile_follow(request: HttpRequest, username: str):
     # Подписаться на автора
-    author = get_object_or_404(User, username=username)
+    author = lookups.users.get_or_404(username)
     if username != request.user.username:
+        # запись идемпотентна; проверка по кэшу могла бы ее пропустить
         Follow.objects.get_or_create(user=request.user, author=author)
+        lookups.forget_follows(request.user.pk)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request: HttpRequest, username: str):
     # Дизлайк, отписка
-    author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user).filter(author=author).delete()
+    author = lookups.users.get_or_404(username)
+    Follow.objects.filter(user=request.user, author=author).delete()
+    lookups.forget_follows(request.user.pk)
     return redirect('posts:profile', username=username)
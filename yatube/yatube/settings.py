@@ -34,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryLogMiddleware',
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,7 +50,7 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.backends.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -70,9 +72,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # соединение переживает запрос: PRAGMA и открытие файла
+        # не повторяются на каждый запрос
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# PRAGMA для каждого нового соединения SQLite (core.signals). WAL: читатели
+# не ждут писателя, а synchronous=normal в WAL не теряет целостность
+# базы, только последние транзакции при сбое питания. cache_size в
+# минус-килобайтах, mmap_size в байтах, busy_timeout в мс
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -64 * 1024,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'memory',
+    'busy_timeout': 5000,
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -89,11 +107,21 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# LocMemCache у каждого воркера свой: сбросы по событиям (ленты, поиск
+# групп и пользователей, подписки) до других воркеров не доходят, и
+# такие записи живут не дольше LOCAL_CACHE_TIMEOUT. С несколькими
+# воркерами нужен общий кэш, например
+# {'BACKEND': 'core.backends.FileBasedCache', 'LOCATION': '/var/tmp/yatube'}
+# (его add атомарен, на нем держатся блокировки пересчета страниц)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.backends.LocMemCache',
     }
 }
+LOCAL_CACHE_TIMEOUT = 20
+
+# страницы лент сбрасываются событиями (posts.caching), срок - страховка
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
 
 LANGUAGE_CODE = 'ru'
 
@@ -119,6 +147,61 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 NUMBER_OF_LINES_ON_PAGE = 10
 
+NUMBER_OF_COMMENTS_ON_PAGE = 20
+
+# ленты считаются не дальше FEED_COUNT_LIMIT постов, счет живет в кэше
+# FEED_COUNT_TIMEOUT секунд; ссылок на страницы - FEED_PAGE_WINDOW
+# по обе стороны от текущей
+FEED_COUNT_LIMIT = 10000
+FEED_COUNT_TIMEOUT = 60
+FEED_PAGE_WINDOW = 3
+
+# группы и пользователи по slug/username (posts.lookups): кэш Django
+# сбрасывается событиями (в LocMemCache запись живет не дольше
+# LOCAL_CACHE_TIMEOUT), LRU процесса живет LOOKUP_LOCAL_TIMEOUT секунд
+LOOKUP_TIMEOUT = 60 * 60
+LOOKUP_LOCAL_TIMEOUT = 5
+LOOKUP_LOCAL_SIZE = 256
+
+# курсорная пагинация лент (?after=/?before=) вместо номеров страниц
+KEYSET_PAGINATION = False
+
+# порог подписчиков, с которого посты автора не раскладываются по лентам;
+# на лету меняется командой set_fanout_threshold
+FANOUT_THRESHOLD = 10000
+
+# превышение бюджета SQL-запросов представления (core.decorators.query_budget):
+# False - предупреждение в лог, True - исключение
+QUERY_BUDGET_RAISE = False
+
+# гистограммы времени ответа, SQL, шаблонов и кэша по представлениям
+# (core.middleware.MetricsMiddleware), отдаются staff по /metrics/
+METRICS_ENABLED = True
+
+# журнал SQL по отпечаткам и представлениям (core.querylog): доля
+# запросов, которые в него попадают (0 - выключен), и порог в мс, после
+# которого для отпечатка снимается EXPLAIN; отчет staff по /slow-queries/
+QUERY_LOG_SAMPLE_RATE = 0.0
+QUERY_LOG_SLOW_MS = 50
+
+# миниатюры картинок постов, которые режутся в фоне после сохранения
+# (posts.thumbnails); шаблоны должны просить те же размеры и опции
+THUMBNAIL_GEOMETRIES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+THUMBNAIL_WORKERS = 2
+# False - резать миниатюры в потоке запроса сразу после коммита
+THUMBNAIL_ASYNC = True
+
+# загруженные картинки постов (posts.images): большая сторона в пикселях,
+# формат и качество пересохранения
+IMAGE_MAX_SIZE = 1920
+IMAGE_FORMAT = 'WEBP'
+IMAGE_QUALITY = 85
+
+# загрузки больше этого размера пишутся во временный файл, а не в память
+FILE_UPLOAD_MAX_MEMORY_SIZE = 512 * 1024
+
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -3,11 +3,15 @@ from django.contrib import admin
 from django.urls import include, path
 from django.conf.urls.static import static
 
+from core.views import metrics_report, slow_queries_report
+
 handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.access_denied'
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_report, name='metrics'),
+    path('slow-queries/', slow_queries_report, name='slow_queries'),
     path('auth/', include('users.urls', namespace='auth')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),